@@ -1,5 +1,19 @@
+import re
 import sys
 
+#'description amount', the description may be several words of letters and the amount has an optional sign and cents
+ENTRY_PATTERN = re.compile(r'\s*([^\W\d_]+(?:\s+[^\W\d_]+)*)\s+([-+]?\d+(?:\.\d{1,2})?)\s*')
+
+def to_cents(amount):
+    #Amounts are added up as whole cents, so no float rounding creeps into the balance
+    whole, _, fraction = amount.lstrip('+-').partition('.')
+    cents = int(whole) * 100 + int(fraction.ljust(2, '0'))
+    return -cents if amount.startswith('-') else cents
+
+def format_cents(cents):
+    whole, fraction = divmod(abs(cents), 100)
+    return f"{'-' if cents < 0 else ''}{whole}.{fraction:02d}"
+
 def get_initial_balance():
     try:
         balance = int(input('How much money do you have?\n'))
@@ -22,9 +36,11 @@ def process_without_comma(records_list, input_str):
         process_single_entry(records_list, input_str)
 
 def process_single_entry(records_list, entry):
-    subparts = entry.split()
-    if len(subparts) == 2 and subparts[0].isalpha() and (subparts[1].isdigit() or (subparts[1][0] == '-' and subparts[1][1:].isdigit())):
-        records_list.append(entry)
+    match = ENTRY_PATTERN.fullmatch(entry)
+    if match:
+        #Keep the record as 'description amount' with single spaces, so it can be split from the right
+        desc, amt = match.groups()
+        records_list.append(f"{' '.join(desc.split())} {amt.lstrip('+')}")
     else:
         sys.stderr.write(f"Invalid input format: {entry}")
         sys.stderr.write(f"Please use 'description amount' format.\n")
@@ -53,33 +69,36 @@ def view_records(records_list, balance):
         print("=" * 30)
 
         total_amount = 0
+        lines = []
         for record in records_list:
-            desc, amt = record.split()
-            amt = int(amt)
-            total_amount += amt
-            print(f"{desc:<20} {amt}")
+            desc, amt = record.rsplit(None, 1)
+            cents = to_cents(amt)
+            total_amount += cents
+            lines.append(f"{desc:<20} {format_cents(cents)}\n")
+        #Write all the records at once instead of one print per record
+        sys.stdout.write(''.join(lines))
 
         print("=" * 30)
         #print(f"{'Total':<20} {total_amount}")
-        print(f"Now you have {balance + total_amount} dollars.")
+        print(f"Now you have {format_cents(balance * 100 + total_amount)} dollars.")
     except Exception as e:          #Exceptoion 8
         sys.stderr.write(f"An error occurred, When trying to View Records: {e}\n")
 
 def delete_record(records_list, balance):
     try:
-        delete_desc = input("Which record do you want to delete?: ")
+        delete_desc = ' '.join(input("Which record do you want to delete?: ").split())
         found = False
         last_index = -1
-        #Check if there is something to delete
-        for i, record in enumerate(records_list):
-            desc, amt = record.split()
+        #Search from the end, the first match is the last entered duplicate
+        for i in range(len(records_list) - 1, -1, -1):
+            desc, amt = records_list[i].rsplit(None, 1)
             if desc == delete_desc:
                 found = True
                 last_index = i
+                break
         #If found delete that data
+        #'balance' is the starting money, the current balance always comes from the remaining records
         if found:
-            desc, amt = records_list[last_index].split()
-            balance -= int(amt)
             del records_list[last_index]
         else:
             print("Invalid description.")
@@ -101,20 +120,24 @@ def save_records(records_list, balance):
 
 def initialize():
     try:
-        with open('records.txt', 'r') as file:
-            records_lines = file.readlines()
-
         # Extract records and balance from the file
         records_list = []
         invalid_lines = []
-        for line in records_lines[:-1]:
-            if has_comma(line):
-                process_with_comma(records_list, line)
-            else:
-                process_without_comma(records_list, line)
+        with open('records.txt', 'r') as file:
+            #Read one line ahead, so the last line is kept back as the balance line
+            previous_line = None
+            for line in file:
+                if previous_line is not None:
+                    if has_comma(previous_line):
+                        process_with_comma(records_list, previous_line)
+                    else:
+                        process_without_comma(records_list, previous_line)
+                previous_line = line
+        if previous_line is None:
+            raise IndexError("records.txt is empty")
 
         # Check if the last line (balance line) has the correct format
-        last_line = records_lines[-1].strip().split(":")
+        last_line = previous_line.strip().split(":")
         if len(last_line) == 2 and last_line[0].strip() == 'Balance' and last_line[1].strip().isdigit():
             balance = int(last_line[1].strip())
             print("Welcome Back!")
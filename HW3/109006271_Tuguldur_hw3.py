@@ -1,77 +1,690 @@
+import abc
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import csv
+import functools
+import hashlib
+import io
+import ipaddress
+import json
+import mmap
+import os
+import pstats
+import re
+import sqlite3
+import struct
 import sys
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from heapq import merge, nlargest, nsmallest
+from itertools import chain, islice
 
-class Record:
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks outside POSIX, concurrent sessions are then not protected
+    fcntl = None
+
+# Ordinal of 1970-01-01, so an epoch day number plus this is a 'date' ordinal
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_timestamp(text):
+    """
+    Convert an ISO date or date-time to seconds since the epoch.
+
+    Dates and date-times without a time zone are taken as UTC.
+
+    Parameters:
+    - text (str): 'YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM:SS'.
+
+    Returns:
+    - int: Seconds since the epoch.
+
+    Raises:
+    - ValueError: If the text is not an ISO date or date-time.
+    """
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def format_timestamp(timestamp):
+    """
+    Convert seconds since the epoch to an ISO date, or date-time if it is not midnight UTC.
+
+    Parameters:
+    - timestamp (int): Seconds since the epoch, NO_DATE for an unknown time.
+
+    Returns:
+    - str: The ISO text, empty for an unknown time.
+    """
+    if timestamp == NO_DATE:
+        return ''
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    if timestamp % 86400 == 0:
+        return moment.strftime('%Y-%m-%d')
+    return moment.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def month_key(day):
+    """
+    Return the month of an epoch day as 'year * 12 + month - 1'.
+
+    Parameters:
+    - day (int): Days since 1970-01-01.
+    """
+    moment = date.fromordinal(day + EPOCH_ORDINAL)
+    return moment.year * 12 + moment.month - 1
+
+
+def month_first_day(month):
+    """
+    Return the epoch day of the first day of a month given as 'year * 12 + month - 1'.
+
+    The month after December 9999 has no date; it starts the day after 'date.max'.
+    """
+    if month // 12 > date.max.year:
+        return date.max.toordinal() + 1 - EPOCH_ORDINAL
+    return date(month // 12, month % 12 + 1, 1).toordinal() - EPOCH_ORDINAL
+
+
+# Words are runs of letters, as 'str.isalpha' accepts them
+WORD = r'[^\W\d_]+'
+# 'category description amount [date]', the description may be several words
+RECORD_PATTERN = re.compile(rf'\s*({WORD})\s+({WORD}(?:\s+{WORD})*)\s+([-+]?\d+(?:\.\d+)?)(?:\s+(\S+))?\s*')
+DESCRIPTION_PATTERN = re.compile(rf'{WORD}(?: {WORD})*')
+AMOUNT_PATTERN = re.compile(r'([-+]?)(\d+)(?:\.(\d+))?')
+# Amounts are kept as whole numbers of minor units (cents), in int64 columns
+AMOUNT_PLACES = 2
+AMOUNT_SCALE = 10 ** AMOUNT_PLACES
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+# Timestamp of a record without a date; 0 is a real time, the start of 1970-01-01
+NO_DATE = INT64_MIN
+
+
+def format_amount(units):
+    """
+    Format an amount of minor units for display, as '-12.50'.
+
+    Parameters:
+    - units (int): The amount in minor units.
+
+    Returns:
+    - str: The amount with its decimal places.
+    """
+    whole, fraction = divmod(abs(units), AMOUNT_SCALE)
+    return f"{'-' if units < 0 else ''}{whole}.{fraction:0{AMOUNT_PLACES}d}"
+
+
+def checked_sum(values):
+    """
+    Sum amounts of minor units, checking that the total still fits in an int64 column.
+
+    An 'array' column is summed in one C-level pass; the total is exact since Python ints do not overflow,
+    so one range check at the end catches an overflow anywhere in the sum.
+
+    Parameters:
+    - values (iterable): The amounts, typically an array('q') column.
+
+    Returns:
+    - int: The total.
+
+    Raises:
+    - OverflowError: If the total does not fit in an int64.
+    """
+    total = sum(values)
+    if not INT64_MIN <= total <= INT64_MAX:
+        raise OverflowError(f"total amount {total} does not fit in 64 bits")
+    return total
+
+
+def is_whole(text):
+    """Return True if the text is a whole amount, digits with an optional sign, small enough for an int64 of cents."""
+    return len(text) <= 16 and (text.isdecimal() or (text[1:].isdecimal() and text[0] in '+-'))
+
+
+def parse_amount(text):
+    """
+    Convert a signed decimal amount to an int of minor units.
+
+    Parameters:
+    - text (str): '-12', '+7' or '3.50'.
+
+    Returns:
+    - int: The amount in minor units.
+
+    Raises:
+    - ValueError: If the text is not an amount, has more nonzero decimals than the amounts keep,
+      or does not fit in an int64 of minor units.
+    """
+    match = AMOUNT_PATTERN.fullmatch(text.strip())
+    if match is None:
+        raise ValueError(f"invalid amount: {text}")
+    sign, whole, fraction = match.groups()
+    if fraction is None:
+        units = int(whole) * AMOUNT_SCALE
+    elif fraction[AMOUNT_PLACES:].strip('0'):
+        raise ValueError(f"too many decimals: {text}")
+    else:
+        units = int(whole + fraction[:AMOUNT_PLACES].ljust(AMOUNT_PLACES, '0'))
+    if sign == '-':
+        units = -units
+    if not INT64_MIN <= units <= INT64_MAX:
+        raise ValueError(f"amount out of range: {text}")
+    return units
+
+
+def parse_description(text):
+    """
+    Normalize a description to words separated by single spaces.
+
+    Raises:
+    - ValueError: If the description is not made of words of letters.
+    """
+    description = text if text.isalpha() else ' '.join(text.split())
+    if not DESCRIPTION_PATTERN.fullmatch(description):
+        raise ValueError(f"invalid description: {text}")
+    return description
+
+
+def description_words(description):
+    """Return the set of search words of a description, case-folded."""
+    return set(description.casefold().split())
+
+
+def parse_search(query):
+    """
+    Split a search query into its case-folded words.
+
+    A word ending with '*' matches every description word that starts with it.
+
+    Parameters:
+    - query (str): The words to search for, separated by spaces.
+
+    Returns:
+    - tuple: The words, in order.
+
+    Raises:
+    - ValueError: If there are no words or a word is not made of letters.
+    """
+    terms = tuple(query.casefold().split())
+    if not terms:
+        raise ValueError("no words to search for")
+    for term in terms:
+        word = term[:-1] if term.endswith('*') else term
+        if word and not word.isalpha():
+            raise ValueError(f"invalid search word: {term}")
+    return terms
+
+
+def split_record(text):
+    """
+    Split a record into its fields with the compiled record pattern.
+
+    Parameters:
+    - text (str): 'category description amount [date]'.
+
+    Returns:
+    - list: The category, description, amount and, if given, date as strings; None if the text is not a record.
+    """
+    match = RECORD_PATTERN.fullmatch(text)
+    if match is None:
+        return None
+    category, description, amount, date_text = match.groups()
+    if not description.isalpha():
+        description = ' '.join(description.split())
+    return [category, description, amount] if date_text is None else [category, description, amount, date_text]
+
+
+def parse_record(text, timestamp=NO_DATE):
+    """
+    Parse a record into typed fields.
+
+    Records with a one-word description and a whole amount are checked field by field,
+    which is faster than matching the pattern and accepts a subset of what it accepts.
+
+    Parameters:
+    - text (str): 'category description amount [date]'.
+    - timestamp (int, optional): The timestamp of a record without a date.
+
+    Returns:
+    - tuple: (category, description, amount, timestamp) with the amount in cents;
+      None if the text is not a record.
+
+    Raises:
+    - ValueError: If the amount has too many decimals or the date is not an ISO date.
+    """
+    parts = text.split()
+    if 3 <= len(parts) <= 4 and parts[0].isalpha() and parts[1].isalpha() and is_whole(parts[2]):
+        if len(parts) == 4:
+            timestamp = parse_timestamp(parts[3])
+        return parts[0], parts[1], int(parts[2]) * AMOUNT_SCALE, timestamp
+    match = RECORD_PATTERN.fullmatch(text)
+    if match is None:
+        return None
+    category, description, amount, date_text = match.groups()
+    description = ' '.join(description.split())
+    amount = parse_amount(amount)
+    if date_text is not None:
+        timestamp = parse_timestamp(date_text)
+    return category, description, amount, timestamp
+
+
+class Metrics:
     """
-    Represents a financial record.
+    Per-operation counters, latency histograms and processed/rejected record counts.
+
+    Operations are timed by methods decorated with 'instrumented'. Nothing is recorded
+    while 'enabled' is False, which costs one attribute check per call.
 
     Attributes:
-    - category (str): The category of the financial record.
-    - description (str): A description of the financial transaction.
-    - amount (int): The monetary amount associated with the transaction.
+    - enabled (bool): Whether operations are recorded.
+    - calls (dict): Maps every operation to its number of calls.
+    - errors (dict): Maps every operation to the number of calls that raised.
+    - seconds (dict): Maps every operation to its total time.
+    - histograms (dict): Maps every operation to its call counts per latency bucket, the last one unbounded.
+    - processed (dict): Maps every operation to the number of records it processed.
+    - rejected (dict): Maps every operation to the number of records it rejected.
+
+    Methods:
+    - observe: Record one call of an operation.
+    - count: Record processed and rejected records.
+    - reset: Forget everything recorded.
+    - to_dict: Return everything recorded as a dict.
+    - to_prometheus: Return everything recorded in the Prometheus text format.
+    - start_profile: Start profiling with cProfile and tracemalloc.
+    - stop_profile: Stop profiling and return the report.
+    """
+    # Upper bounds, in seconds, of the latency buckets
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        """Initialize empty, disabled metrics."""
+        self.enabled = False
+        self._profile = None
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded."""
+        self.calls = {}
+        self.errors = {}
+        self.seconds = {}
+        self.histograms = {}
+        self.processed = {}
+        self.rejected = {}
+
+    def observe(self, name, seconds, failed=False):
+        """
+        Record one call of an operation.
+
+        Parameters:
+        - name (str): The operation.
+        - seconds (float): How long the call took.
+        - failed (bool, optional): True if the call raised.
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = [0] * (len(self.BUCKETS) + 1)
+        histogram[bisect_left(self.BUCKETS, seconds)] += 1
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def count(self, name, processed=0, rejected=0):
+        """
+        Record the records an operation processed and rejected.
+
+        Parameters:
+        - name (str): The operation.
+        - processed (int, optional): Number of records processed.
+        - rejected (int, optional): Number of records rejected.
+        """
+        self.processed[name] = self.processed.get(name, 0) + processed
+        self.rejected[name] = self.rejected.get(name, 0) + rejected
+
+    def to_dict(self):
+        """
+        Return everything recorded as a dict, keyed by operation.
+        """
+        operations = {}
+        for name in sorted(set(self.calls) | set(self.processed)):
+            histogram = self.histograms.get(name, [0] * (len(self.BUCKETS) + 1))
+            operations[name] = {
+                'calls': self.calls.get(name, 0),
+                'errors': self.errors.get(name, 0),
+                'seconds': self.seconds.get(name, 0.0),
+                'histogram': {str(bound): count for bound, count in zip(self.BUCKETS + ('+Inf',), histogram)},
+                'processed': self.processed.get(name, 0),
+                'rejected': self.rejected.get(name, 0),
+            }
+        return operations
+
+    def to_prometheus(self):
+        """
+        Return everything recorded in the Prometheus text exposition format.
+        """
+        lines = ["# TYPE pymoney_operation_seconds histogram"]
+        for name in sorted(self.calls):
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + ('+Inf',), self.histograms[name]):
+                cumulative += count
+                lines.append(f'pymoney_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'pymoney_operation_seconds_sum{{operation="{name}"}} {self.seconds[name]}')
+            lines.append(f'pymoney_operation_seconds_count{{operation="{name}"}} {self.calls[name]}')
+        for metric, values in (('errors', self.errors), ('records_processed', self.processed),
+                               ('records_rejected', self.rejected)):
+            lines.append(f"# TYPE pymoney_{metric}_total counter")
+            lines += [f'pymoney_{metric}_total{{operation="{name}"}} {value}' for name, value in sorted(values.items())]
+        return ''.join(line + '\n' for line in lines)
+
+    @property
+    def profiling(self):
+        """True while cProfile and tracemalloc are running."""
+        return self._profile is not None
+
+    def start_profile(self):
+        """
+        Start profiling every call with cProfile and tracing allocations with tracemalloc.
+        """
+        if self._profile is None:
+            tracemalloc.start()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop_profile(self, limit=20):
+        """
+        Stop profiling and return the report.
+
+        Parameters:
+        - limit (int, optional): Number of functions and allocation sites listed.
+
+        Returns:
+        - str: The functions with the most cumulative time, then the lines that allocated the most memory.
+        """
+        if self._profile is None:
+            return ''
+        self._profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats('cumulative').print_stats(limit)
+        self._profile = None
+        out.write("Top allocations:\n")
+        for stat in snapshot.statistics('lineno')[:limit]:
+            out.write(f"{stat}\n")
+        return out.getvalue()
+
+
+METRICS = Metrics()
+
+
+def instrumented(name):
+    """
+    Decorate a function so that its calls are recorded in 'METRICS' under an operation name.
+
+    Parameters:
+    - name (str): The operation name, e.g. 'records.add'.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                METRICS.observe(name, time.perf_counter() - start, failed)
+        return wrapper
+    return decorate
+
+
+class Record:
+    """
+    Represents a financial record, as a view over one row of a 'RecordStore'.
+
+    A Record holds no copy of the data, only the store and the position of its row, so handing
+    one out costs two references. The view follows the row: it must not be used once the row
+    has been deleted or the store compacted.
 
     Properties:
-    - category: Getter property for accessing the category attribute.
-    - description: Getter property for accessing the description attribute.
-    - amount: Getter property for accessing the amount attribute.
+    - category: Getter property for the category of the record.
+    - description: Getter property for the description of the record.
+    - amount: Getter property for the amount of the record, in cents.
+    - timestamp: Getter property for the timestamp of the record, in seconds since the epoch (NO_DATE if unknown).
     """
-    def __init__(self, category, description, amount):
+    __slots__ = ('_store', '_position')
+
+    def __init__(self, store, position):
         """
-        Initialize a financial record with the specified category, description, and amount.
+        Initialize a view over a row of a store.
 
         Parameters:
-        - category (str): The category of the financial record.
-        - description (str): A description of the financial transaction.
-        - amount (int): The monetary amount associated with the transaction.
+        - store (RecordStore): The store holding the row.
+        - position (int): The position of the row.
         """
-        # Initialize attributes
-        self._category = category
-        self._description = description
-        self._amount = amount
+        self._store = store
+        self._position = position
 
     @property
     def category(self):
         """Getter property for the category attribute."""
-        return self._category
+        return self._store.name(self._store.categories[self._position])
 
     @property
     def description(self):
         """Getter property for the description attribute."""
-        return self._description
+        return self._store.name(self._store.descriptions[self._position])
 
     @property
     def amount(self):
         """Getter property for the amount attribute."""
-        return self._amount
+        return self._store.amounts[self._position]
+
+    @property
+    def timestamp(self):
+        """Getter property for the timestamp attribute."""
+        return self._store.timestamps[self._position]
 
 
 class Categories:
     """
-    Manages a hierarchical list of categories and provides methods for operations.
+    Manages a tree of categories that can be edited and saved next to the ledger.
+
+    Every category has a label, its position in hierarchy order spaced out with gaps, and the
+    label of the last category of its subtree. A subtree is therefore a range of labels:
+    "is X under Y" is a comparison and "all categories under Y" a slice. Adding or moving a
+    category only labels its own subtree, in the gap left where it goes; the whole tree is
+    labelled again only when that gap is used up.
 
     Attributes:
-    - _categories (list): The hierarchical list of categories.
+    - _filename (str): The file the tree is saved to, None if it is not saved.
+    - _roots (list): The top level category names, in order.
+    - _parent (dict): Maps every category name to its parent name (None for top level).
+    - _children (dict): Maps every category name to the list of its direct children.
+    - _enter (dict): Maps every category name to its label.
+    - _last (dict): Maps every category name to the label of the last category of its subtree.
+    - _order (tuple): Every category name in hierarchy order, built again after an edit.
+    - version (int): Incremented by every edit of the tree.
+    - _categories (list): The tree as a nested list, e.g. ['expense', ['food', ...], ...].
 
     Methods:
     - view: Displays the categories in a hierarchical structure.
     - is_category_valid: Checks if a given category is valid within the hierarchy.
-    - find_categories: Finds and returns subcategories of a given category using a generator.
+    - is_under: Checks if a category is in the subtree of another.
+    - find_categories: Returns a category and its subcategories in hierarchy order.
+    - subtree: Returns the cached frozenset of a category and all its subcategories.
+    - depth: Returns the number of ancestors of a category.
+    - rollup: Adds up per-category amounts over every subtree.
+    - add: Adds a category.
+    - rename: Renames a category.
+    - move: Moves a category and its subtree under another parent.
+    - save: Saves the tree to its file.
     """
-    def __init__(self):
+    DEFAULT = ['expense', ['food', ['meal', 'snack', 'drink'], 'transport', ['bus', 'railway']],
+               'income', ['salary', 'bonus']]
+    # Distance between the labels of consecutive categories after a full labelling
+    GAP = 1 << 16
+
+    def __init__(self, filename=None):
+        """
+        Initializes a Categories instance from a saved tree, or with the default tree.
+
+        Parameters:
+        - filename (str, optional): The file the tree is read from and saved to.
+        """
+        self._filename = filename
+        self.version = 0
+        tree = self.DEFAULT
+        if filename is not None:
+            try:
+                with open(filename, 'r') as file:
+                    tree = self._parse(file)
+            except FileNotFoundError:
+                pass
+            except ValueError as e:
+                sys.stderr.write(f"Invalid category file {filename}: {e}\n")
+                sys.stderr.write(f"Using the default categories.\n")
+        self._categories = tree
+
+    @staticmethod
+    def _parse(file):
+        """
+        Parse a saved tree, one name per line indented by two spaces per level.
+
+        Returns:
+        - list: The tree as a nested list.
+
+        Raises:
+        - ValueError: If a name is not alphabetic, is repeated or is indented too deep.
+        """
+        tree = []
+        # stack[depth] is the list the categories of that depth are appended to
+        stack = [tree]
+        seen = set()
+        for line in file:
+            name = line.strip()
+            if not name:
+                continue
+            depth = (len(line) - len(line.lstrip(' '))) // 2
+            if not name.isalpha() or name in seen or depth >= len(stack):
+                raise ValueError(f"invalid line: {line.rstrip()}")
+            seen.add(name)
+            del stack[depth + 1:]
+            stack[depth].append(name)
+            children = []
+            stack[depth].append(children)
+            stack.append(children)
+
+        def prune(categories):
+            # Leaves were given an empty child list while parsing
+            return [prune(item) if isinstance(item, list) else item
+                    for item in categories if not isinstance(item, list) or item]
+        return prune(tree)
+
+    @property
+    def _categories(self):
+        """The tree as a nested list, the children of a name in a list right after it."""
+        def nest(names):
+            nested = []
+            for name in names:
+                nested.append(name)
+                if self._children[name]:
+                    nested.append(nest(self._children[name]))
+            return nested
+        return nest(self._roots)
+
+    @_categories.setter
+    def _categories(self, categories):
+        """Replace the whole tree with a nested list."""
+        self._roots = []
+        self._parent = {}
+        self._children = {}
+
+        def walk(categories, parent):
+            last = None
+            for item in categories:
+                if isinstance(item, list):
+                    # A nested list holds the children of the name right before it
+                    walk(item, last)
+                else:
+                    self._parent[item] = parent
+                    self._children[item] = []
+                    (self._roots if parent is None else self._children[parent]).append(item)
+                    last = item
+
+        walk(categories, None)
+        self._reindex()
+
+    def _reindex(self):
         """
-        Initializes a Categories instance with a default hierarchical list.
+        Label the whole tree again, spacing the labels by 'GAP'.
         """
-        self._categories = ['expense',['food', ['meal', 'snack', 'drink'], 'transport', ['bus', 'railway']], 'income', ['salary', 'bonus']]
+        self._enter = {}
+        self._last = {}
+        label = 0
+
+        def walk(name):
+            nonlocal label
+            self._enter[name] = label
+            label += self.GAP
+            for child in self._children[name]:
+                walk(child)
+            children = self._children[name]
+            self._last[name] = self._last[children[-1]] if children else self._enter[name]
+
+        for root in self._roots:
+            walk(root)
+        self._changed()
+
+    def _changed(self):
+        """Drop the caches built from the labels."""
+        self.version += 1
+        self._order_cache = None
+        self._labels = None
+        self._subtrees = {}
+
+    @property
+    def _order(self):
+        """Every category name in hierarchy order."""
+        if self._order_cache is None:
+            self._order_cache = tuple(sorted(self._enter, key=self._enter.__getitem__))
+            self._labels = [self._enter[name] for name in self._order_cache]
+        return self._order_cache
+
+    def _range(self, category):
+        """Return the slice of '_order' holding the subtree of a category."""
+        # '_labels' is built along with '_order'
+        self._order
+        return slice(bisect_left(self._labels, self._enter[category]),
+                     bisect_left(self._labels, self._last[category] + 1))
 
     def view(self, categories=None, index=0):
         """
         Displays the categories in a hierarchical structure.
 
         Parameters:
-        - categories (list, optional): The list of categories to display.
+        - categories (list, optional): The nested list of categories to display, the whole tree if not given.
         - index (int, optional): The indentation level for proper formatting.
         """
         if categories is None:
-            categories = self._categories
+            for name in self._order:
+                print(' ' * (index + 2 * self.depth(name)) + name)
+            return
         for item in categories:
             if isinstance(item, list):
                 self.view(item, index + 2)
@@ -84,176 +697,2592 @@ class Categories:
 
         Parameters:
         - category (str): The category to check for validity.
-        - categories (list, optional): The list of categories to search within.
+        - categories (list, optional): The nested list of categories to search within.
 
         Returns:
         - bool: True if the category is valid, False otherwise.
         """
         if categories is None:
-            categories = self._categories
+            # The whole tree is answered from the index
+            return category in self._parent
         if category in categories:
-            # Check if the current item is a list (indicating subcategories)
-            # and recursively call the function to search within the subcategories.
             return True
         for item in categories:
             if isinstance(item, list) and self.is_category_valid(category, item):
                 return True
         return False
 
+    def is_under(self, category, ancestor):
+        """
+        Checks if a category is in the subtree of another, itself included.
+
+        Parameters:
+        - category (str): The category to check.
+        - ancestor (str): The root of the subtree.
+
+        Returns:
+        - bool: True if 'category' is 'ancestor' or one of its subcategories.
+        """
+        if category not in self._enter or ancestor not in self._enter:
+            return False
+        return self._enter[ancestor] <= self._enter[category] <= self._last[ancestor]
 
+    @instrumented('categories.find_categories')
     def find_categories(self, category):
-            """
-                Finds and returns subcategories of a given category using a generator.
-
-                Parameters:
-                - category (str): The category for which to find subcategories.
-
-                Returns:
-                - list: A list containing the subcategories of the specified category.
-            """
-            def find_categories_gen(category, categories, found=False):
-                if type(categories) == list:
-                    for index, child in enumerate(categories):
-                         # Recursively yield subcategories using the generator.
-                        yield from find_categories_gen(category, child, found)
-                         # When the target category is found, set a flag to True
-                        # and yield subcategories in the next level.
-                        if child == category and index + 1 < len(categories) and type(categories[index + 1]) == list:
-                            flag = True
-                            for i in categories[index + 1]:
-                                yield from find_categories_gen(category, i, flag)
-                else:
-                    # If the current category matches the target or the flag is True,
-                    # yield the current category.
-                    if category == categories or found == True:
-                        yield categories
+        """
+        Finds and returns subcategories of a given category.
 
-            return [i for i in find_categories_gen(category, self._categories)]
+        Parameters:
+        - category (str): The category for which to find subcategories.
+
+        Returns:
+        - list: A list containing the category and its subcategories in hierarchy order,
+          or an empty list if the category does not exist.
+        """
+        if category not in self._enter:
+            return []
+        return list(self._order[self._range(category)])
 
+    @instrumented('categories.subtree')
+    def subtree(self, category):
+        """
+        Returns a category and all its subcategories as a set.
 
+        Parameters:
+        - category (str): The root category of the subtree.
 
-class Records:
-    """Maintain a list of all the 'Record's and the initial amount of money."""
+        Returns:
+        - frozenset: The cached subtree, empty if the category does not exist.
+        """
+        subtree = self._subtrees.get(category)
+        if subtree is None:
+            if category not in self._enter:
+                return frozenset()
+            subtree = self._subtrees[category] = frozenset(self._order[self._range(category)])
+        return subtree
+
+    def depth(self, category):
+        """
+        Returns the number of ancestors of a category, 0 for a top level category.
+        """
+        depth = 0
+        parent = self._parent[category]
+        while parent is not None:
+            depth += 1
+            parent = self._parent[parent]
+        return depth
+
+    def rollup(self, totals):
+        """
+        Adds up per-category amounts over every subtree in one bottom-up pass.
+
+        Parameters:
+        - totals (dict): Maps category names to the amount of their own records.
+
+        Returns:
+        - dict: Maps every category name to the amount of its whole subtree.
+        """
+        rolled = {}
+        for name in reversed(self._order):
+            rolled[name] = checked_sum([totals.get(name, 0)] + [rolled[child] for child in self._children[name]])
+        return rolled
+
+    def _siblings(self, category):
+        """Return the list holding a category and its siblings."""
+        parent = self._parent[category]
+        return self._roots if parent is None else self._children[parent]
+
+    def _update_last(self, category):
+        """Recompute the last label of a category and of its ancestors, after its children changed."""
+        while category is not None:
+            children = self._children[category]
+            last = self._last[children[-1]] if children else self._enter[category]
+            if self._last[category] == last:
+                break
+            self._last[category] = last
+            category = self._parent[category]
+
+    def _label_subtree(self, category):
+        """
+        Label the subtree of a category that was just appended to its siblings, in the gap
+        between the category before it and the one after it in hierarchy order.
+        """
+        siblings = self._siblings(category)
+        parent = self._parent[category]
+        if len(siblings) > 1:
+            low = self._last[siblings[-2]]
+        elif parent is not None:
+            low = self._enter[parent]
+        else:
+            low = -self.GAP
+        # The next category in hierarchy order is the next sibling of the closest ancestor that has one
+        high = None
+        ancestor = parent
+        while ancestor is not None and high is None:
+            ancestor_siblings = self._siblings(ancestor)
+            index = ancestor_siblings.index(ancestor)
+            if index + 1 < len(ancestor_siblings):
+                high = self._enter[ancestor_siblings[index + 1]]
+            ancestor = self._parent[ancestor]
+        names = []
+        def walk(name):
+            names.append(name)
+            for child in self._children[name]:
+                walk(child)
+        walk(category)
+        if high is None:
+            high = low + (len(names) + 1) * self.GAP
+        step = (high - low) // (len(names) + 1)
+        if step < 1:
+            # The gap is used up
+            self._reindex()
+            return
+        for i, name in enumerate(names, 1):
+            self._enter[name] = low + i * step
+        for name in reversed(names):
+            children = self._children[name]
+            self._last[name] = self._last[children[-1]] if children else self._enter[name]
+        self._update_last(parent)
+        self._changed()
+
+    def _check_new_name(self, name):
+        """Raise ValueError if a name cannot be given to a new category."""
+        if not name.isalpha():
+            raise ValueError(f"category names must be alphabetic: {name}")
+        if name in self._parent:
+            raise ValueError(f"category already exists: {name}")
+
+    def _check_exists(self, name):
+        """Raise ValueError if a category does not exist; None stands for the top level and always does."""
+        if name is not None and name not in self._parent:
+            raise ValueError(f"no such category: {name}")
+
+    def add(self, name, parent=None):
+        """
+        Adds a category as the last child of a parent and saves the tree.
+
+        Parameters:
+        - name (str): The new category.
+        - parent (str, optional): The parent category, top level if None.
+
+        Raises:
+        - ValueError: If the name is taken or invalid, or the parent does not exist.
+        """
+        self._check_new_name(name)
+        self._check_exists(parent)
+        self._parent[name] = parent
+        self._children[name] = []
+        (self._roots if parent is None else self._children[parent]).append(name)
+        self._label_subtree(name)
+        self.save()
+
+    def rename(self, old, new):
+        """
+        Renames a category and saves the tree. No label changes.
+
+        Parameters:
+        - old (str): The current name.
+        - new (str): The new name.
+
+        Raises:
+        - ValueError: If the old name does not exist, or the new one is taken or invalid.
+        """
+        if old not in self._parent:
+            raise ValueError(f"no such category: {old}")
+        self._check_new_name(new)
+        siblings = self._siblings(old)
+        siblings[siblings.index(old)] = new
+        self._parent[new] = self._parent.pop(old)
+        self._children[new] = self._children.pop(old)
+        for child in self._children[new]:
+            self._parent[child] = new
+        self._enter[new] = self._enter.pop(old)
+        self._last[new] = self._last.pop(old)
+        self._changed()
+        self.save()
+
+    def move(self, name, parent=None):
+        """
+        Moves a category and its subtree to the end of the children of another parent and saves the tree.
+
+        Parameters:
+        - name (str): The category to move.
+        - parent (str, optional): The new parent category, top level if None.
+
+        Raises:
+        - ValueError: If a category does not exist, or the parent is in the subtree being moved.
+        """
+        if name not in self._parent:
+            raise ValueError(f"no such category: {name}")
+        self._check_exists(parent)
+        if parent is not None and self.is_under(parent, name):
+            raise ValueError(f"cannot move {name} under its own subtree")
+        old_parent = self._parent[name]
+        self._siblings(name).remove(name)
+        self._update_last(old_parent)
+        self._parent[name] = parent
+        (self._roots if parent is None else self._children[parent]).append(name)
+        self._label_subtree(name)
+        self.save()
+
+    def save(self):
+        """
+        Saves the tree to its file, one name per line indented by two spaces per level.
+        """
+        if self._filename is None:
+            return
+        with open(self._filename + '.tmp', 'w') as file:
+            file.writelines(f"{'  ' * self.depth(name)}{name}\n" for name in self._order)
+        os.replace(self._filename + '.tmp', self._filename)
+
+
+class RecordReader:
     """
-    Manage a list of 'Record' instances and the initial amount of money.
+    Lazily parse a records file line by line.
+
+    A record line is 'category description amount', optionally followed by an ISO date or date-time,
+    parsed with 'parse_record'.
 
     Attributes:
-    - _records (list): List containing 'Record' instances.
-    - _balance (int): The balance amount.
-    - _categories_manager (Categories): Instance of the Categories class.
-    - _categories (list): The hierarchical list of categories.
+    - initial_money (int): The balance from the 'Balance:' line in cents, known once the file is read through.
+    - balance_seen (bool): True once a 'Balance:' line has been read.
+    - invalid_count (int): Number of invalid lines reported so far.
 
     Methods:
-    - add: Add records to the list based on user input.
-    - view: Display all records and report the current balance.
-    - delete: Delete a record based on the provided description.
-    - find: Display records based on specified categories and report the total amount.
-    - save: Save the current balance and all records to 'records.txt'.
+    - __iter__: Yield (category, description, amount, timestamp) tuples for the valid lines.
     """
-    def __init__(self, categories_manager):
+    def __init__(self, file, on_invalid=None):
         """
-        Initialize a Records instance.
+        Initialize a RecordReader over an open file.
 
         Parameters:
-        - categories_manager (Categories): Instance of the Categories class.
+        - file (file): An open text file, or any iterable of lines.
+        - on_invalid (callable, optional): Called with every invalid line instead of writing it to stderr.
         """
-        # Instantiate Categories
-        self._records = []
-        self._balance = 0
-        self._categories_manager = categories_manager
-        self._categories = categories_manager._categories 
-        # Read from 'records.txt' or prompt for initial amount of money
-        try:
-            #Try to open the file with method
-            with open('records.txt', 'r') as file:
-                records_lines = file.readlines()
-            print("Welcome back!")
-            # Extract records and balance from the file
-            self._records = []
-            self._initial_money = 0
-            invalid_lines = []
-
-            #Get the data of records with their category == part[0], descripton == part[1], amount == part[3]
-            for line in records_lines:
-                parts = line.strip().split()
-                if len(parts) == 3 and parts[0].isalpha() and parts[1].isalpha() \
-                        and (parts[2].isdigit() or (parts[2][0] == '-' and parts[2][1:].isdigit())):
-                    record = Record(parts[0], parts[1], int(parts[2]))
-                    self._records.append(record)
-                elif line.startswith('Balance:'):
+        self._file = file
+        self._on_invalid = on_invalid
+        self.initial_money = 0
+        self.balance_seen = False
+        self.invalid_count = 0
+
+    def __iter__(self):
+        """
+        Yield (category, description, amount, timestamp) tuples, reporting invalid lines to stderr as they come.
+
+        The timestamp is NO_DATE for a line without a date.
+        """
+        scale = AMOUNT_SCALE
+        for line in self._file:
+            # The fast path of 'parse_record' for a record without a date is inlined, it is most of the lines
+            parts = line.split()
+            if len(parts) == 3 and parts[0].isalpha() and parts[1].isalpha():
+                amount = parts[2]
+                if len(amount) <= 16 and (amount.isdecimal() or (amount[1:].isdecimal() and amount[0] in '+-')):
+                    yield parts[0], parts[1], int(amount) * scale, NO_DATE
+                    continue
+            try:
+                record = parse_record(line)
+            except ValueError:
+                record = None
+            if record is not None:
+                yield record
+                continue
+            if line.startswith('Balance:'):
                 #Get balance from the last line of the record.txt file
-                    try:
-                        self._initial_money = int(line.split(":")[1].strip())
-                    except ValueError:
-                        sys.stderr.write(f"Invalid balance format in records.txt.\n")
-                        self._initial_money = 0
-                else:
-                    invalid_lines.append(line)
-            #Detect and Remove invalid lines from record.txt file
-            if invalid_lines:
-                sys.stderr.write(f"Invalid input formats in records.txt:\n")
-                for line in invalid_lines:
-                    sys.stderr.write(f"{line.strip()}\n")
-        #Exception handling
-        except (FileNotFoundError,RuntimeError,IndexError,ValueError,PermissionError):
-            # If records.txt doesn't exist, prompt for initial balance
-            self._initial_money = get_initial_balance()
-            self._records = []
-        except Exception as e:
-            sys.stderr.write(f"An unexpected error occurred: {e}\n")
-            sys.stderr.write(f"Initializing with default values.\n")
-            self._initial_money = 0
-            self._records = []
+                self.balance_seen = True
+                try:
+                    self.initial_money = parse_amount(line.split(":")[1])
+                except ValueError:
+                    sys.stderr.write(f"Invalid balance format in records.txt.\n")
+                    self.initial_money = 0
+            elif self._on_invalid is not None:
+                self.invalid_count += 1
+                self._on_invalid(line)
+            else:
+                if self.invalid_count == 0:
+                    sys.stderr.write(f"Invalid input formats in records.txt:\n")
+                self.invalid_count += 1
+                sys.stderr.write(f"{line.strip()}\n")
+
+
+def _parse_range(filename, start, end):
+    """
+    Parse the lines of a records file that start between two byte offsets, and index them.
+
+    Runs in a worker process of 'load_parallel'. The index pieces hold positions within the chunk
+    and are keyed by strings, so they can be merged without going over the rows again.
+
+    Parameters:
+    - filename (str): The records file.
+    - start (int): First byte offset of the range.
+    - end (int): Byte offset just past the range.
+
+    Returns:
+    - tuple: The chunk's string table, its category codes, description codes, amounts and timestamps
+      as arrays, its index pieces (see 'load_parallel'), its invalid lines, and its balance
+      (None without a 'Balance:' line).
+    """
+    store = RecordStore()
+    positions = {}
+    totals = {}
+    counts = {}
+    descriptions = {}
+    daily = {}
+    monthly = {}
+    invalid = []
+
+    def lines():
+        with open(filename, 'rb') as file:
+            if start:
+                # A line that begins before 'start' belongs to the previous range
+                file.seek(start - 1)
+                file.readline()
+            position = file.tell()
+            while position < end:
+                line = file.readline()
+                if not line:
+                    break
+                position += len(line)
+                yield line.decode('utf-8')
+
+    reader = RecordReader(lines(), on_invalid=invalid.append)
+    # The same steps as 'Records._index_record'
+    for category, description, amount, timestamp in reader:
+        position = store.append(category, description, amount, timestamp)
+        bucket = positions.get(category)
+        if bucket is None:
+            bucket = positions[category] = array('q')
+        bucket.append(position)
+        totals[category] = totals.get(category, 0) + amount
+        counts[category] = counts.get(category, 0) + 1
+        stack = descriptions.get(description)
+        if stack is None:
+            stack = descriptions[description] = array('q')
+        stack.append(position)
+        if timestamp != NO_DATE:
+            day = timestamp // 86400
+            days = daily.get(category)
+            if days is None:
+                days = daily[category] = {}
+                monthly[category] = {}
+            days[day] = days.get(day, 0) + amount
+            months = monthly[category]
+            month = month_key(day)
+            months[month] = months.get(month, 0) + amount
+    timestamps = store.timestamps
+    dated = array('q', sorted((position for position, timestamp in enumerate(timestamps)
+                               if timestamp != NO_DATE), key=timestamps.__getitem__))
+    index = {'positions': positions, 'totals': totals, 'counts': counts, 'descriptions': descriptions,
+             'daily': daily, 'monthly': monthly, 'time_positions': dated}
+    balance = reader.initial_money if reader.balance_seen else None
+    return (store._names, store.categories, store.descriptions, store.amounts, store.timestamps,
+            index, invalid, balance)
+
+
+def _byte_ranges(filename, workers):
+    """Split a file into about four byte ranges per worker."""
+    size = os.path.getsize(filename)
+    step = max(1 << 20, -(-size // (workers * 4)))
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def _merge_totals(merged, totals):
+    """Add a dict of totals into another, key by key."""
+    for key, total in totals.items():
+        merged[key] = merged.get(key, 0) + total
+
+
+def load_parallel(filename, workers=None):
+    """
+    Parse and index a text records file in parallel, one byte range per task, aligned on line boundaries.
+
+    Parameters:
+    - filename (str): The records file.
+    - workers (int, optional): Number of worker processes, the number of CPUs unless given.
+
+    Returns:
+    - tuple: The records as a 'RecordStore', its indexes, the invalid lines in file order, and the
+      balance (None without a 'Balance:' line). The indexes are a dict of the 'Records' indexes of
+      the same names: 'positions', 'totals', 'counts', 'descriptions', 'daily', 'monthly',
+      'times' and 'time_positions'.
+    """
+    store = RecordStore()
+    positions = {}
+    totals = {}
+    counts = {}
+    descriptions = {}
+    daily = {}
+    monthly = {}
+    dated = array('q')
+    invalid = []
+    balance = None
+    ranges = _byte_ranges(filename, workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_parse_range, filename, start, end) for start, end in ranges]
+        # Chunks are merged in file order, so positions and messages keep their order
+        for future in futures:
+            (names, categories, descriptions_column, amounts, timestamps,
+             chunk, chunk_invalid, chunk_balance) = future.result()
+            # Positions within the chunk are moved by the number of rows before it
+            shift = len(store).__add__
+            codes = [store.intern(name) for name in names]
+            store.categories.extend(array('i', map(codes.__getitem__, categories)))
+            store.descriptions.extend(array('i', map(codes.__getitem__, descriptions_column)))
+            store.amounts.extend(amounts)
+            store.timestamps.extend(timestamps)
+            for merged, pieces in ((positions, chunk['positions']), (descriptions, chunk['descriptions'])):
+                for key, piece in pieces.items():
+                    bucket = merged.get(key)
+                    if bucket is None:
+                        merged[key] = array('q', map(shift, piece))
+                    else:
+                        bucket.extend(map(shift, piece))
+            _merge_totals(totals, chunk['totals'])
+            _merge_totals(counts, chunk['counts'])
+            for merged, pieces in ((daily, chunk['daily']), (monthly, chunk['monthly'])):
+                for category, rollup in pieces.items():
+                    _merge_totals(merged.setdefault(category, {}), rollup)
+            dated.extend(map(shift, chunk['time_positions']))
+            invalid += chunk_invalid
+            if chunk_balance is not None:
+                balance = chunk_balance
+    timestamps = store.timestamps
+    # Every chunk is sorted already and a stable sort keeps the file order of equal timestamps,
+    # so this only merges the sorted runs
+    time_positions = array('q', sorted(dated, key=timestamps.__getitem__))
+    index = {'positions': positions, 'totals': totals, 'counts': counts, 'descriptions': descriptions,
+             'daily': daily, 'monthly': monthly, 'time_positions': time_positions,
+             'times': array('q', map(timestamps.__getitem__, time_positions))}
+    return store, index, invalid, balance
+
+
+def stream_view(filename='records.txt'):
+    """
+    Display all records of a file and report the balance without loading the file into memory.
+
+    Changes still in the journal are not included.
+
+    Parameters:
+    - filename (str, optional): The records file to read.
+    """
+    with open(filename, 'r') as file:
+        reader = RecordReader(file)
+        total_amount = 0
+        print(f"{'Category':<15} {'Description':<20} {'Amount'}")
+        print("=" * 55)
+        for category, desc, amt, _ in reader:
+            total_amount += amt
+            print(f"{category:<15} {desc:<20} {format_amount(amt)}")
+        print("=" * 55)
+        print(f"Now you have {format_amount(reader.initial_money + total_amount)} dollars.")
+
+
+def stream_find(categories_manager, category, filename='records.txt'):
+    """
+    Display the records of a file under a category without loading the file into memory.
+
+    Changes still in the journal are not included.
+
+    Parameters:
+    - categories_manager (Categories): Instance of the Categories class.
+    - category (str): The category whose subtree is searched.
+    - filename (str, optional): The records file to read.
+    """
+    subcategories = categories_manager.subtree(category)
+    current_money = 0
+    found = False
+    dash = '=' * 40
+    with open(filename, 'r') as file:
+        for record_category, desc, amt, _ in RecordReader(file):
+            if record_category in subcategories:
+                if not found:
+                    print(f"{'Category':<15} {'Description':<20} {'Amount'}")
+                    print(dash)
+                    found = True
+                current_money += amt
+                print(f"{record_category:<15} {desc:<20} {format_amount(amt)}")
+    if not found:
+        print(f"No records found for the specified categories.")
+        return
+    print(dash)
+    print(f'The total amount above is {format_amount(current_money)} dollars.')
+
+
+class RecordStore:
+    """
+    Column-oriented storage for records.
+
+    Categories and descriptions are interned into one string table and stored as integer codes,
+    amounts (in cents) and timestamps are stored in typed int64 arrays. A deleted row keeps its position with the category code -1
+    and an amount of 0, so the amount column can always be summed as a whole.
+
+    Attributes:
+    - categories (array): Category code of every row.
+    - descriptions (array): Description code of every row.
+    - amounts (array): Amount of every row.
+    - timestamps (array): Timestamp of every row, in seconds since the epoch (NO_DATE if unknown).
+    - _names (list): Maps a code to its string.
+    - _codes (dict): Maps a string to its code.
+    - _deleted (int): Number of deleted rows.
+
+    Methods:
+    - append: Store a row and return its position.
+    - kill: Mark a row as deleted.
+    - row: Return a row as a (category, description, amount, timestamp) tuple.
+    - record: Return a row as a 'Record' view.
+    - rows: Yield the rows that have not been deleted.
+    - has_deleted: Check whether any row has been deleted.
+    - from_snapshot: Build a store from a 'Snapshot'.
+    - total: Sum the amounts of the rows that have not been deleted.
+    - total_at: Sum the amounts of the rows at the given positions.
+    - compacted: Return a new store without the deleted rows.
+    """
+    DELETED = -1
+
+    def __init__(self):
+        """
+        Initialize an empty RecordStore.
+        """
+        self.categories = array('i')
+        self.descriptions = array('i')
+        self.amounts = array('q')
+        self.timestamps = array('q')
+        self._names = []
+        self._codes = {}
+        self._deleted = 0
+
+    def __len__(self):
+        """Number of positions, deleted rows included."""
+        return len(self.amounts)
+
+    def intern(self, name):
+        """
+        Return the code of a string, adding it to the table if needed.
+
+        Parameters:
+        - name (str): The string to encode.
+
+        Returns:
+        - int: The code of the string.
+        """
+        code = self._codes.get(name)
+        if code is None:
+            code = len(self._names)
+            self._codes[name] = code
+            self._names.append(name)
+        return code
+
+    def name(self, code):
+        """Return the string of a code."""
+        return self._names[code]
+
+    def append(self, category, description, amount, timestamp=NO_DATE):
+        """
+        Store a row.
+
+        Parameters:
+        - category (str): The category of the record.
+        - description (str): The description of the record.
+        - amount (int): The amount of the record.
+        - timestamp (int, optional): Seconds since the epoch, NO_DATE if unknown.
+
+        Returns:
+        - int: The position of the new row.
+        """
+        self.categories.append(self.intern(category))
+        self.descriptions.append(self.intern(description))
+        self.amounts.append(amount)
+        self.timestamps.append(timestamp)
+        return len(self.amounts) - 1
+
+    def kill(self, position):
+        """Mark the row at 'position' as deleted."""
+        self.categories[position] = self.DELETED
+        self.amounts[position] = 0
+        self._deleted += 1
+
+    def has_deleted(self):
+        """Return True if any row has been deleted."""
+        return self._deleted > 0
+
+    def is_live(self, position):
+        """Return True if the row at 'position' has not been deleted."""
+        return self.categories[position] != self.DELETED
+
+    def row(self, position):
+        """Return the row at 'position' as a (category, description, amount, timestamp) tuple."""
+        names = self._names
+        return (names[self.categories[position]], names[self.descriptions[position]],
+                self.amounts[position], self.timestamps[position])
+
+    def record(self, position):
+        """Return the row at 'position' as a 'Record' view, without copying it."""
+        return Record(self, position)
+
+    def rows(self):
+        """
+        Yield (category, description, amount, timestamp) tuples for the rows that have not been deleted.
+        """
+        names = self._names
+        for category, description, amount, timestamp in zip(self.categories, self.descriptions,
+                                                             self.amounts, self.timestamps):
+            if category != self.DELETED:
+                yield names[category], names[description], amount, timestamp
+
+    def total(self):
+        """Sum the amounts of the rows that have not been deleted."""
+        # Deleted rows hold 0, so the whole column is summed in one C-level call
+        return checked_sum(self.amounts)
+
+    def total_at(self, positions):
+        """
+        Sum the amounts of the rows at the given positions.
+
+        Parameters:
+        - positions (iterable): Positions of the rows, deleted rows add nothing.
+        """
+        return checked_sum(map(self.amounts.__getitem__, positions))
+
+    def compacted(self):
+        """
+        Return a new store holding only the rows that have not been deleted.
+
+        Strings that are no longer used are dropped from the new table.
+        """
+        store = RecordStore()
+        for row in self.rows():
+            store.append(*row)
+        return store
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Build a store from a 'Snapshot' by copying its columns as raw bytes.
+
+        Parameters:
+        - snapshot (Snapshot): An open snapshot.
+        """
+        store = cls()
+        store.categories.frombytes(snapshot.categories.cast('B'))
+        store.descriptions.frombytes(snapshot.descriptions.cast('B'))
+        store.amounts.frombytes(snapshot.amounts.cast('B'))
+        if snapshot.timestamps is None:
+            store.timestamps = array('q', [NO_DATE]) * len(store.amounts)
+        else:
+            store.timestamps.frombytes(snapshot.timestamps.cast('B'))
+        store._names = list(snapshot.names)
+        store._codes = {name: code for code, name in enumerate(store._names)}
+        return store
+
+
+class Snapshot:
+    """
+    Read-only, memory-mapped view of a binary ledger snapshot.
+
+    Layout (little-endian): a header with the magic bytes, the format version, the initial amount
+    of money, the number of rows and the number of strings; the string lengths as uint32 and the
+    UTF-8 string bytes; then, aligned on 8 bytes, the category codes and description codes as
+    int32, and the amounts and timestamps as int64. Version 1 files have no timestamp column,
+    and versions 1 and 2 keep whole dollars, which are converted to cents when the file is opened.
+
+    Attributes:
+    - initial_money (int): The initial amount of money, in cents.
+    - names (list): The string table, indexed by code.
+    - categories (memoryview): Category code of every row, read straight from the file.
+    - descriptions (memoryview): Description code of every row, read straight from the file.
+    - amounts (memoryview): Amount of every row in cents, read straight from the file (converted for old versions).
+    - timestamps (memoryview): Timestamp of every row, None for a version 1 file.
+
+    Methods:
+    - is_snapshot: Check whether a file is a binary snapshot.
+    - write: Write a 'RecordStore' as a binary snapshot.
+    - close: Release the memory map.
+    """
+    MAGIC = b'PYMONEY\x00'
+    VERSION = 3
+    HEADER = struct.Struct('<8sIxxxxqQQ')
+
+    def __init__(self, filename):
+        """
+        Map a snapshot file into memory.
+
+        Parameters:
+        - filename (str): The snapshot file.
+
+        Raises:
+        - ValueError: If the file is not a snapshot of a supported version.
+        """
+        with open(filename, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        try:
+            magic, version, self.initial_money, rows, count = self.HEADER.unpack_from(self._view)
+            if magic != self.MAGIC or not 1 <= version <= self.VERSION:
+                raise ValueError(f"{filename} is not a version 1 to {self.VERSION} snapshot")
+            offset = self.HEADER.size
+            lengths = self._column(offset, count, 'I')
+            offset += 4 * count
+            self.names = []
+            for length in lengths:
+                self.names.append(str(self._view[offset:offset + length], 'utf-8'))
+                offset += length
+            lengths.release()
+            offset += -offset % 8
+            self.categories = self._column(offset, rows, 'i')
+            offset += 4 * rows
+            self.descriptions = self._column(offset, rows, 'i')
+            offset += 4 * rows
+            self.amounts = self._column(offset, rows, 'q')
+            offset += 8 * rows
+            self.timestamps = self._column(offset, rows, 'q') if version >= 2 else None
+            if version < 3:
+                dollars = self.amounts
+                self.amounts = memoryview(array('q', [amount * AMOUNT_SCALE for amount in dollars]))
+                dollars.release()
+                self.initial_money *= AMOUNT_SCALE
+        except Exception:
+            self._view.release()
+            self._mmap.close()
+            raise
+
+    def _column(self, offset, count, typecode):
+        """
+        Return a typed view of 'count' items starting at 'offset'.
+
+        The view points straight into the memory map; only big-endian hosts get a swapped copy.
+        """
+        size = array(typecode).itemsize
+        column = self._view[offset:offset + size * count].cast(typecode)
+        if sys.byteorder == 'big':
+            swapped = array(typecode)
+            swapped.frombytes(column.cast('B'))
+            swapped.byteswap()
+            column.release()
+            column = memoryview(swapped)
+        return column
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the column views and the memory map."""
+        for column in (self.categories, self.descriptions, self.amounts, self.timestamps):
+            if column is not None:
+                column.release()
+        self._view.release()
+        self._mmap.close()
+
+    @classmethod
+    def is_snapshot(cls, filename):
+        """
+        Check whether a file starts with the snapshot magic bytes.
+
+        Raises:
+        - FileNotFoundError: If the file does not exist.
+        """
+        with open(filename, 'rb') as file:
+            return file.read(len(cls.MAGIC)) == cls.MAGIC
+
+    @classmethod
+    def write(cls, file, store, initial_money):
+        """
+        Write the rows of a store that have not been deleted as a binary snapshot.
+
+        Parameters:
+        - file (file): A file open for binary writing.
+        - store (RecordStore): The records to write.
+        - initial_money (int): The initial amount of money.
+        """
+        if store.has_deleted():
+            store = store.compacted()
+        names = [name.encode('utf-8') for name in store._names]
+        lengths = array('I', [len(name) for name in names])
+        offset = cls.HEADER.size + 4 * len(names) + sum(lengths)
+        columns = [lengths, store.categories, store.descriptions, store.amounts, store.timestamps]
+        if sys.byteorder == 'big':
+            columns = [array(column.typecode, column) for column in columns]
+            for column in columns:
+                column.byteswap()
+
+        file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, initial_money, len(store), len(names)))
+        columns[0].tofile(file)
+        file.write(b''.join(names))
+        # The two int32 columns have the same length, so the int64 columns stay aligned too
+        file.write(b'\x00' * (-offset % 8))
+        for column in columns[1:]:
+            column.tofile(file)
+
+
+def snapshot_view(filename):
+    """
+    Display all records of a binary snapshot and report the balance, reading the columns in place.
+
+    Changes still in the journal are not included.
+
+    Parameters:
+    - filename (str): The snapshot file.
+    """
+    with Snapshot(filename) as snapshot:
+        names = snapshot.names
+        print(f"{'Category':<15} {'Description':<20} {'Amount'}")
+        print("=" * 55)
+        for category, desc, amt in zip(snapshot.categories, snapshot.descriptions, snapshot.amounts):
+            print(f"{names[category]:<15} {names[desc]:<20} {format_amount(amt)}")
+        print("=" * 55)
+        print(f"Now you have {format_amount(snapshot.initial_money + checked_sum(snapshot.amounts))} dollars.")
+
+
+class Journal:
+    """
+    Append-only log of the changes made since 'records.txt' was last written.
+
+    The first line holds a fingerprint of the content of the snapshot the journal was started
+    against, so a journal that was already folded into a newer snapshot is never replayed twice,
+    while a copied or touched snapshot still matches. A journal that does not match is never
+    deleted: if it holds changes it is set aside and the ledger is not opened. Records added
+    together follow a 'batch <count>' line and are only replayed if the whole batch was written.
+
+    Several processes may share a journal. Each remembers which snapshot it read and
+    how far it has read the journal, so it can tell whether the ledger was rewritten
+    and replay only the operations appended by the others.
+
+    Attributes:
+    - count (int): Number of operations in the journal.
+    - offset (int): Size in bytes of the part of the journal that has been read or written.
+
+    Methods:
+    - replay: Yield the operations of a journal that matches the snapshot.
+    - replay_tail: Yield the operations appended since the journal was last read or written.
+    - is_current: Check whether the snapshot is still the one the journal was read against.
+    - discard_tail: Cut off an unfinished batch left at the end of the journal.
+    - write_add: Log added records.
+    - write_delete: Log deleted descriptions.
+    - write_balance: Log the initial amount of money.
+    - restart: Start an empty journal against the current snapshot.
+    - close: Close the journal file.
+    """
+    def __init__(self, filename='records.txt.journal', snapshot='records.txt'):
+        """
+        Initialize a Journal.
+
+        Parameters:
+        - filename (str, optional): The journal file.
+        - snapshot (str, optional): The records file the journal is replayed on top of.
+        """
+        self._filename = filename
+        self._snapshot = snapshot
+        self._file = None
+        self._snapshot_seen = None
+        self._fingerprint_seen = None
+        self._hashed = (None, None)
+        self.count = 0
+        self.offset = 0
+
+    def _snapshot_id(self):
+        """Return a string that changes whenever the snapshot file is rewritten, cheap to get."""
+        try:
+            stat = os.stat(self._snapshot)
+        except FileNotFoundError:
+            return "none"
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _fingerprint(self):
+        """
+        Return a string that identifies the content of the snapshot file, "none" if there is none.
+
+        The file is hashed once for every '_snapshot_id' it has.
+        """
+        try:
+            file = open(self._snapshot, 'rb')
+        except FileNotFoundError:
+            return "none"
+        with file:
+            stat = os.fstat(file.fileno())
+            snapshot_id = f"{stat.st_size}:{stat.st_mtime_ns}"
+            if self._hashed[0] != snapshot_id:
+                digest = hashlib.blake2b(digest_size=16)
+                for block in iter(functools.partial(file.read, 1 << 20), b''):
+                    digest.update(block)
+                self._hashed = (snapshot_id, f"{stat.st_size}:{digest.hexdigest()}")
+        return self._hashed[1]
+
+    def _set_aside(self):
+        """
+        Move a journal that does not match the snapshot out of the way, and refuse to go on.
+
+        Raises:
+        - RuntimeError: Always, naming where the journal was kept.
+        """
+        stale = self._filename + '.stale'
+        number = 1
+        while os.path.exists(stale):
+            stale = f"{self._filename}.stale{number}"
+            number += 1
+        try:
+            os.replace(self._filename, stale)
+        except FileNotFoundError:
+            # Another process set it aside first
+            pass
+        raise RuntimeError(f"{self._filename} holds changes made on top of another version of {self._snapshot}. "
+                           f"It was kept as {stale}; add its records again to keep them.")
+
+    def replay(self):
+        """
+        Yield the logged operations as tuples: ('add', category, description, amount, timestamp),
+        ('delete', description) or ('balance', amount).
+
+        An unfinished last line is ignored.
+
+        Raises:
+        - RuntimeError: If the journal holds changes but was started against another snapshot;
+          it is then set aside, see '_set_aside'.
+        """
+        self.close()
+        self.count = 0
+        self.offset = 0
+        self._snapshot_seen = self._snapshot_id()
+        try:
+            file = open(self._filename, 'rb')
+        except FileNotFoundError:
+            return
+        with file:
+            header_line = file.readline()
+            self._fingerprint_seen = self._fingerprint()
+            if header_line.decode().split() != ['snapshot', self._fingerprint_seen]:
+                stale = True
+                pending = file.readline() != b''
+            else:
+                stale = False
+                self.offset = len(header_line)
+                yield from self._replay_lines(file)
+        if stale:
+            if pending:
+                self._set_aside()
+            # Nothing to lose, start over so new operations are not appended behind the old header
+            self.restart()
+
+    def replay_tail(self):
+        """
+        Yield the operations appended, by this process or others, since the journal was last read or written.
+
+        Only meaningful while 'is_current' is True.
+        """
+        try:
+            file = open(self._filename, 'rb')
+        except FileNotFoundError:
+            return
+        with file:
+            if self.offset == 0:
+                # The journal was created after it was last read; skip its header
+                self.offset = len(file.readline())
+            file.seek(self.offset)
+            yield from self._replay_lines(file)
+
+    def is_current(self):
+        """
+        Check whether the snapshot is still the one the journal was read against.
+
+        Returns:
+        - bool: False if another process rewrote the snapshot since.
+        """
+        snapshot_id = self._snapshot_id()
+        if snapshot_id == self._snapshot_seen:
+            return True
+        # A 'touch' or a copy changes the modification time but not the records
+        if self._fingerprint() == self._fingerprint_seen:
+            self._snapshot_seen = snapshot_id
+            return True
+        return False
+
+    def discard_tail(self):
+        """
+        Cut off what follows the last complete operation, an unfinished batch left by a crashed process.
+
+        Must be called with the ledger locked for writing, right after 'replay_tail'.
+        """
+        try:
+            if os.path.getsize(self._filename) > self.offset > 0:
+                self.close()
+                os.truncate(self._filename, self.offset)
+        except FileNotFoundError:
+            pass
+
+    def _replay_lines(self, file):
+        """
+        Yield the operations of the journal lines read from a binary file, moving 'offset'
+        past every complete operation or batch.
+        """
+        batch = []
+        expected = 0
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            size = len(line)
+            line = line.decode()
+            parts = line.split()
+            try:
+                if parts[0] == 'batch' and len(parts) == 2:
+                    batch = []
+                    expected = int(parts[1])
+                    batch_size = size
+                    continue
+                elif parts[0] == 'add' and len(parts) >= 4:
+                    # Journals written before records had a timestamp end with the amount,
+                    # descriptions are letters so the numbers at the end tell the two apart
+                    # Amounts are decimals, so whole dollars of older journals read as the same cents
+                    if len(parts) >= 5 and not parts[-2].isalpha():
+                        operation = 'add', parts[1], ' '.join(parts[2:-2]), parse_amount(parts[-2]), int(parts[-1])
+                    else:
+                        operation = 'add', parts[1], ' '.join(parts[2:-1]), parse_amount(parts[-1]), NO_DATE
+                elif parts[0] == 'delete' and len(parts) >= 2:
+                    operation = 'delete', ' '.join(parts[1:])
+                elif parts[0] == 'balance' and len(parts) == 2:
+                    operation = 'balance', parse_amount(parts[1])
+                else:
+                    raise ValueError(line)
+            except (IndexError, ValueError):
+                sys.stderr.write(f"Invalid line in {self._filename}: {line.strip()}\n")
+                if not expected:
+                    self.offset += size
+                continue
+            self.count += 1
+            if expected:
+                # Hold the batch back until its last line has been read
+                batch.append(operation)
+                batch_size += size
+                if len(batch) == expected:
+                    self.offset += batch_size
+                    yield from batch
+                    expected = 0
+            else:
+                self.offset += size
+                yield operation
+
+    def _open(self):
+        """Open the journal for appending, writing the header if the file is new."""
+        if self._file is None:
+            self._file = open(self._filename, 'a')
+            if self._file.tell() == 0:
+                self._snapshot_seen = self._snapshot_id()
+                self._fingerprint_seen = self._fingerprint()
+                self._file.write(f"snapshot {self._fingerprint_seen}\n")
+
+    def _write(self, lines):
+        """Append lines to the journal and flush them to the operating system."""
+        self._open()
+        self._file.writelines(lines)
+        self._file.flush()
+        self.count += len(lines)
+        # Writers hold the ledger lock, so everything up to the end of the file has been seen
+        self.offset = os.fstat(self._file.fileno()).st_size
+
+    def write_add(self, rows):
+        """
+        Log added records as one batch.
+
+        Parameters:
+        - rows (list): (category, description, amount, timestamp) tuples.
+        """
+        if rows:
+            # A record without a date is logged without a timestamp, like the lines of older journals
+            lines = [f"add {category} {description} {format_amount(amount)}"
+                     f"{'' if timestamp == NO_DATE else f' {timestamp}'}\n"
+                     for category, description, amount, timestamp in rows]
+            if len(lines) > 1:
+                lines.insert(0, f"batch {len(lines)}\n")
+                self.count -= 1
+            self._write(lines)
+
+    def write_delete(self, descriptions):
+        """
+        Log deleted descriptions.
+
+        Parameters:
+        - descriptions (list): The descriptions of the deleted records.
+        """
+        if descriptions:
+            self._write([f"delete {description}\n" for description in descriptions])
+
+    def write_balance(self, amount):
+        """Log the initial amount of money."""
+        self._write([f"balance {format_amount(amount)}\n"])
+
+    def restart(self):
+        """Start an empty journal against the snapshot that was just written."""
+        self.close()
+        self._snapshot_seen = self._snapshot_id()
+        self._fingerprint_seen = self._fingerprint()
+        header = f"snapshot {self._fingerprint_seen}\n"
+        with open(self._filename, 'w') as file:
+            file.write(header)
+        self.count = 0
+        self.offset = len(header.encode())
+
+    def close(self):
+        """Close the journal file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LedgerLock:
+    """
+    Advisory 'fcntl' lock on a ledger, shared by every process working on it.
+
+    Writers hold it exclusively while they append to the journal or rewrite the ledger;
+    readers hold it shared only while they read the journal. Nested holds in the same
+    process are counted, so only the outermost one locks and unlocks. Without 'fcntl'
+    holding the lock does nothing.
+
+    Methods:
+    - hold: Context manager holding the lock.
+    - close: Close the lock file.
+    """
+    def __init__(self, filename):
+        """
+        Initialize a LedgerLock.
+
+        Parameters:
+        - filename (str): The lock file, created on first use.
+        """
+        self._filename = filename
+        self._file = None
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def hold(self, exclusive=True):
+        """
+        Hold the lock for the duration of a 'with' block.
+
+        Parameters:
+        - exclusive (bool, optional): True for writing, False to share the lock with other readers.
+        """
+        if fcntl is None:
+            yield
+            return
+        if self._depth == 0:
+            if self._file is None:
+                self._file = open(self._filename, 'a')
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        """Close the lock file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Storage(abc.ABC):
+    """
+    Interface of a storage backend that keeps the records outside of memory.
+
+    'Records' keeps its records in a 'RecordStore' logged to a 'Journal' unless it is
+    given a Storage, in which case every change and query goes through the Storage.
+    Rows are (category, description, amount, timestamp) tuples.
+
+    Attributes:
+    - initial_money (int): The initial amount of money, None for a new ledger.
+
+    Methods:
+    - set_initial_money: Store the initial amount of money.
+    - add: Store rows.
+    - delete: Delete the most recently added row of every description.
+    - rows: Yield all rows in the order they were added.
+    - find: Return the rows of some categories, optionally within a time range.
+    - search: Return the rows whose description has every one of some words.
+    - total: Return the total amount of some categories.
+    - category_totals: Return the total amount of every category.
+    - month_totals: Return the month by month totals of some categories within a time range.
+    - rename_category: Move every row of a category to another category name.
+    - version: Return a value that changes whenever another connection changes the records.
+    - balance: Return the current balance.
+    - verify: Check the running balance against a full recompute.
+    - close: Make every change durable and release the backend.
+    """
+    initial_money = None
+
+    @abc.abstractmethod
+    def set_initial_money(self, amount):
+        """Store the initial amount of money."""
+
+    @abc.abstractmethod
+    def add(self, rows):
+        """Store rows."""
+
+    @abc.abstractmethod
+    def delete(self, descriptions):
+        """Delete the most recently added row of every description and return the descriptions not found."""
+
+    @abc.abstractmethod
+    def rows(self):
+        """Yield all rows in the order they were added."""
+
+    @abc.abstractmethod
+    def find(self, categories, start=None, end=None):
+        """Return the rows of some categories, in time order within '[start, end)' if a range is given."""
+
+    @abc.abstractmethod
+    def search(self, terms, categories=None):
+        """Return the rows whose description has every one of some words, optionally within some categories."""
+
+    @abc.abstractmethod
+    def total(self, categories):
+        """Return the total amount of some categories."""
+
+    @abc.abstractmethod
+    def category_totals(self):
+        """Return a dict of the total amount of every category that has rows."""
+
+    @abc.abstractmethod
+    def month_totals(self, categories, start, end):
+        """Return a dict of the month by month totals of some categories between two timestamps."""
+
+    @abc.abstractmethod
+    def rename_category(self, old, new):
+        """Move every row of a category to another category name."""
+
+    @abc.abstractmethod
+    def version(self):
+        """Return a value that changes whenever another connection changes the records."""
+
+    @abc.abstractmethod
+    def balance(self):
+        """Return the current balance."""
+
+    @abc.abstractmethod
+    def verify(self):
+        """Check the running balance against a full recompute and return True if it matches."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Make every change durable and release the backend."""
+
+
+class SQLiteStorage(Storage):
+    """
+    Keep the records in a SQLite database.
+
+    The database runs in WAL mode with indexes on category, description and timestamp.
+    Finds and totals are SQL queries, so only their results are read into Python and
+    the ledger does not have to fit in memory. The running total of all amounts is kept
+    in the 'meta' table next to the initial amount of money, so the balance is read in O(1).
+    Amounts are integers of cents and are added up with SUM, which fails on an overflow
+    instead of rounding like TOTAL; databases of whole dollars are converted when opened.
+    The 'words' table is an inverted index from the case-folded words of the descriptions
+    to the descriptions, kept in the same transactions as the records.
+
+    Attributes:
+    - initial_money (int): The initial amount of money, None for a new ledger.
+    - _connection (sqlite3.Connection): The open database.
+    - _total (int): The total amount of all the records.
+    """
+    MAGIC = b'SQLite format 3\x00'
+    EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS records_category ON records (category, amount);
+        CREATE INDEX IF NOT EXISTS records_description ON records (description);
+        CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+        CREATE TABLE IF NOT EXISTS words (
+            word TEXT NOT NULL,
+            description TEXT NOT NULL,
+            PRIMARY KEY (word, description)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, filename='records.db'):
+        """
+        Open a database, creating its tables and indexes if needed.
+
+        Parameters:
+        - filename (str, optional): The database file.
+        """
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL a commit only waits for the log to be written, not for a checkpoint
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.executescript(self.SCHEMA)
+        self._upgrade()
+        self.initial_money = self._meta('initial_money')
+        self._total = self._meta('total')
+        if self._total is None:
+            self._total = self._sum("SELECT SUM(amount) FROM records")
+
+    @classmethod
+    def is_database(cls, filename):
+        """
+        Check whether a file is a SQLite database, or a new file named like one.
+        """
+        try:
+            with open(filename, 'rb') as file:
+                return file.read(len(cls.MAGIC)) == cls.MAGIC
+        except FileNotFoundError:
+            return os.path.splitext(filename)[1] in cls.EXTENSIONS
+
+    def _meta(self, key):
+        """Return a value of the 'meta' table, None if it is not set."""
+        row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        """Set a value of the 'meta' table, inside the caller's transaction."""
+        self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _upgrade(self):
+        """
+        Bring a database written by an older version up to date, in a single transaction:
+        amounts of whole dollars are scaled to cents and the word index is filled.
+        """
+        # The write lock is taken first, so two connections never both upgrade
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            places = self._meta('amount_places')
+            if places is None:
+                # Only databases written before this key existed lack it, and they kept whole dollars
+                places = 0 if self._connection.execute("SELECT 1 FROM meta").fetchone() else AMOUNT_PLACES
+            if places != AMOUNT_PLACES:
+                scale = 10 ** (AMOUNT_PLACES - places)
+                self._connection.execute("UPDATE records SET amount = amount * ?", (scale,))
+                self._connection.execute(
+                    "UPDATE meta SET value = value * ? WHERE key IN ('initial_money', 'total')", (scale,))
+            self._set_meta('amount_places', AMOUNT_PLACES)
+            if self._meta('words') is None:
+                descriptions = self._connection.execute("SELECT DISTINCT description FROM records")
+                self._add_words(description for description, in descriptions)
+                self._set_meta('words', 1)
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+
+    def _sum(self, query, parameters=()):
+        """
+        Return the single SUM of a query as an int, 0 for no rows.
+
+        Raises:
+        - OverflowError: If the sum does not fit in 64 bits.
+        """
+        try:
+            total = self._connection.execute(query, parameters).fetchone()[0]
+        except sqlite3.OperationalError as e:
+            if 'overflow' in str(e):
+                raise OverflowError(f"total amount does not fit in 64 bits: {e}") from e
+            raise
+        return total or 0
+
+    def _add_words(self, descriptions):
+        """Add descriptions to the word index, inside the caller's transaction."""
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO words (word, description) VALUES (?, ?)",
+            [(word, description) for description in set(descriptions) for word in description_words(description)])
+
+    @staticmethod
+    def _placeholders(categories):
+        """Return the '?, ?, ...' list for an IN clause over the categories."""
+        return ', '.join('?' * len(categories))
+
+    def set_initial_money(self, amount):
+        """
+        Store the initial amount of money.
+
+        Parameters:
+        - amount (int): The initial amount of money.
+        """
+        with self._connection:
+            self._set_meta('initial_money', amount)
+        self.initial_money = amount
+
+    def add(self, rows):
+        """
+        Store rows with one prepared insert, in a single transaction.
+
+        Parameters:
+        - rows (list): (category, description, amount, timestamp) tuples.
+        """
+        if not rows:
+            return
+        added = checked_sum(row[2] for row in rows)
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO records (category, description, amount, timestamp) VALUES (?, ?, ?, ?)", rows)
+            self._add_words(row[1] for row in rows)
+            self._set_meta('total', self._total + added)
+        self._total += added
+
+    def delete(self, descriptions):
+        """
+        Delete the most recently added row of every description, in a single transaction.
+
+        A description listed twice deletes its two most recently added rows.
+
+        Parameters:
+        - descriptions (iterable): Descriptions of the rows to be deleted.
+
+        Returns:
+        - list: The descriptions that did not match any row.
+        """
+        not_found = []
+        removed = 0
+        with self._connection:
+            for description in descriptions:
+                row = self._connection.execute(
+                    "SELECT id, amount FROM records WHERE description = ? ORDER BY id DESC LIMIT 1",
+                    (description,)).fetchone()
+                if row is None:
+                    not_found.append(description)
+                    continue
+                self._connection.execute("DELETE FROM records WHERE id = ?", (row[0],))
+                # The words of a description stay indexed while it has rows left
+                self._connection.execute(
+                    "DELETE FROM words WHERE description = ? AND NOT EXISTS "
+                    "(SELECT 1 FROM records WHERE description = ?)", (description, description))
+                removed += row[1]
+            self._set_meta('total', self._total - removed)
+        self._total -= removed
+        return not_found
+
+    def rows(self):
+        """
+        Yield all rows in the order they were added, streamed from the database.
+        """
+        yield from self._connection.execute(
+            "SELECT category, description, amount, timestamp FROM records ORDER BY id")
+
+    def find(self, categories, start=None, end=None):
+        """
+        Return the rows of some categories.
+
+        Parameters:
+        - categories (collection): The category names.
+        - start (int, optional): Only keep rows with a timestamp at or after this one.
+        - end (int, optional): Only keep rows with a timestamp before this one.
+
+        Returns:
+        - list: The rows in the order they were added, or in time order if a range is given.
+        """
+        categories = list(categories)
+        query = (f"SELECT category, description, amount, timestamp FROM records "
+                 f"WHERE category IN ({self._placeholders(categories)})")
+        if start is None and end is None:
+            return self._connection.execute(query + " ORDER BY id", categories).fetchall()
+        # Undated rows have the timestamp NO_DATE, below every range
+        query += " AND timestamp >= ? AND timestamp < ? ORDER BY timestamp, id"
+        start = NO_DATE + 1 if start is None else max(start, NO_DATE + 1)
+        end = INT64_MAX if end is None else end
+        return self._connection.execute(query, categories + [start, end]).fetchall()
+
+    def search(self, terms, categories=None):
+        """
+        Return the rows whose description has every one of some words, found through the word index.
+
+        Parameters:
+        - terms (iterable): Case-folded words; a word ending with '*' matches the words starting with it.
+        - categories (collection, optional): Only keep rows of these categories.
+
+        Returns:
+        - list: The rows in the order they were added.
+        """
+        selects = []
+        parameters = []
+        for term in terms:
+            if not term.endswith('*'):
+                selects.append("SELECT description FROM words WHERE word = ?")
+                parameters.append(term)
+            elif term == '*':
+                selects.append("SELECT description FROM words")
+            else:
+                # The words starting with a prefix are a range of the primary key
+                prefix = term[:-1]
+                selects.append("SELECT description FROM words WHERE word >= ? AND word < ?")
+                parameters += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        query = (f"SELECT category, description, amount, timestamp FROM records "
+                 f"WHERE description IN ({' INTERSECT '.join(selects)})")
+        if categories is not None:
+            categories = list(categories)
+            query += f" AND category IN ({self._placeholders(categories)})"
+            parameters += categories
+        return self._connection.execute(query + " ORDER BY id", parameters).fetchall()
+
+    def total(self, categories):
+        """
+        Return the total amount of some categories.
+
+        Parameters:
+        - categories (collection): The category names.
+        """
+        categories = list(categories)
+        return self._sum(f"SELECT SUM(amount) FROM records WHERE category IN ({self._placeholders(categories)})",
+                         categories)
+
+    def category_totals(self):
+        """
+        Return the total amount of every category that has records.
+        """
+        return {category: total for category, total in self._connection.execute(
+            "SELECT category, SUM(amount) FROM records GROUP BY category")}
+
+    def month_totals(self, categories, start, end):
+        """
+        Return the month by month totals of some categories.
+
+        Parameters:
+        - categories (collection): The category names.
+        - start (int): First timestamp of the range.
+        - end (int): Timestamp just after the range.
+
+        Returns:
+        - dict: Maps the months that have records, as 'year * 12 + month - 1', to their total.
+        """
+        categories = list(categories)
+        query = (f"SELECT CAST(strftime('%Y', timestamp, 'unixepoch') AS INTEGER) * 12"
+                 f" + CAST(strftime('%m', timestamp, 'unixepoch') AS INTEGER) - 1 AS month, SUM(amount)"
+                 f" FROM records WHERE category IN ({self._placeholders(categories)})"
+                 f" AND timestamp >= ? AND timestamp < ? GROUP BY month")
+        return {month: total
+                for month, total in self._connection.execute(query, categories + [max(start, NO_DATE + 1), end])}
+
+    def rename_category(self, old, new):
+        """
+        Move every row of a category to another category name, in a single transaction.
+        """
+        with self._connection:
+            self._connection.execute("UPDATE records SET category = ? WHERE category = ?", (new, old))
+
+    def version(self):
+        """
+        Return a value that changes whenever another connection commits a change.
+        """
+        return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def balance(self):
+        """
+        Return the initial amount of money plus the amounts of all the records.
+        """
+        return (self.initial_money or 0) + self._total
+
+    def verify(self):
+        """
+        Recompute the total of all the records and compare it with the running total,
+        reporting a mismatch to stderr.
+
+        Returns:
+        - bool: True if it matches.
+        """
+        expected = self._sum("SELECT SUM(amount) FROM records")
+        if expected != self._total:
+            sys.stderr.write(f"Balance mismatch: running {format_amount(self.balance())}, "
+                             f"recomputed {format_amount((self.initial_money or 0) + expected)}\n")
+            return False
+        return True
+
+    def close(self):
+        """
+        Close the database; every change was already committed.
+        """
+        self._connection.close()
+
+
+class IngestReport:
+    """
+    Outcome of a bulk ingestion.
+
+    Attributes:
+    - added (int): Number of records added.
+    - errors (list): (row number, row, reason) tuples for the rejected rows.
+
+    Methods:
+    - reject: Record a rejected row.
+    - summary: Return a one-line summary.
+    """
+    def __init__(self):
+        """
+        Initialize an empty IngestReport.
+        """
+        self.added = 0
+        self.errors = []
+
+    def reject(self, number, row, reason):
+        """
+        Record a rejected row.
+
+        Parameters:
+        - number (int): The 1-based number of the row in the input.
+        - row: The row as it was given.
+        - reason (str): Why the row was rejected.
+        """
+        self.errors.append((number, row, reason))
+
+    def summary(self):
+        """Return a one-line summary of the ingestion."""
+        return f"{self.added} record(s) added, {len(self.errors)} row(s) rejected."
+
+
+def select_rows(rows, offset=0, limit=None, top=None, bottom=None):
+    """
+    Pick the rows to display.
+
+    The 'top' largest or 'bottom' smallest amounts are picked with a heap, without sorting
+    every row; 'offset' and 'limit' then page through what is left.
+
+    Parameters:
+    - rows (iterable): (category, description, amount, timestamp) tuples.
+    - offset (int, optional): Number of rows skipped.
+    - limit (int, optional): Maximum number of rows kept, all if None.
+    - top (int, optional): Keep the rows with the largest amounts, largest first.
+    - bottom (int, optional): Keep the rows with the smallest amounts, smallest first.
+
+    Returns:
+    - iterable: The picked rows.
+    """
+    if top is not None:
+        rows = nlargest(top, rows, key=lambda row: row[2])
+    elif bottom is not None:
+        rows = nsmallest(bottom, rows, key=lambda row: row[2])
+    if offset or limit is not None:
+        rows = islice(rows, offset, None if limit is None else offset + limit)
+    return rows
+
+
+def render_rows(rows, output_format='table', footer=None, summary=None, width=55, chunk_rows=4096):
+    """
+    Format rows in bulk and yield the output in chunks of many rows each.
+
+    Parameters:
+    - rows (iterable): (category, description, amount, timestamp) tuples, the amounts in cents.
+    - output_format (str, optional): 'table', 'csv' or 'json'; JSON amounts are decimal strings, exact at any size.
+    - footer (str, optional): Line written under a table.
+    - summary (dict, optional): Amounts in cents written after the records of a JSON object.
+    - width (int, optional): Width of the rules around a table.
+    - chunk_rows (int, optional): Number of rows per chunk.
+
+    Yields:
+    - str: The next part of the output.
+    """
+    rows = iter(rows)
+    # Every format yields a head, the chunks of rows and a tail, so pages fall between row chunks
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(['category', 'description', 'amount', 'date'])
+        yield buffer.getvalue()
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows((category, desc, format_amount(amt), format_timestamp(timestamp))
+                             for category, desc, amt, timestamp in chunk)
+            yield buffer.getvalue()
+            if len(chunk) < chunk_rows:
+                break
+        yield ''
+    elif output_format == 'json':
+        separator = '\n'
+        yield '{"records": ['
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            yield separator + ',\n'.join(json.dumps([category, desc, format_amount(amt),
+                                                     None if timestamp == NO_DATE else timestamp])
+                                         for category, desc, amt, timestamp in chunk)
+            separator = ',\n'
+        closing = ''.join(f', {json.dumps(key)}: {json.dumps(format_amount(value))}'
+                          for key, value in (summary or {}).items())
+        yield f'\n]{closing}}}\n'
+    else:
+        yield f"{'Category':<15} {'Description':<20} {'Amount'}\n{'=' * width}\n"
+        line = "%-15s %-20s %s\n"
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            yield ''.join([line % (category, desc, format_amount(amt)) for category, desc, amt, _ in chunk])
+            if len(chunk) < chunk_rows:
+                break
+        yield f"{'=' * width}\n" + (f"{footer}\n" if footer else '')
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of query results, each stored with the versions it was computed at.
+
+    An entry is only returned if the versions asked for are the ones it was stored with,
+    so a result goes stale as soon as anything it depends on changes, without writers
+    having to look for the entries they affect.
+
+    Attributes:
+    - capacity (int): Maximum number of entries.
+    - hits (int): Number of lookups answered from the cache.
+    - misses (int): Number of lookups that found no entry, or a stale one.
+    - evictions (int): Number of entries dropped to make room.
+
+    Methods:
+    - get: Return a cached result, or None.
+    - put: Store a result.
+    - clear: Drop every entry.
+    - stats: Return the hit and miss statistics.
+    """
+    def __init__(self, capacity=128):
+        """
+        Initialize an empty ResultCache.
+
+        Parameters:
+        - capacity (int, optional): Maximum number of entries.
+        """
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, versions):
+        """
+        Return the result cached for a query, or None if there is none for these versions.
+
+        Parameters:
+        - key (tuple): The query.
+        - versions (tuple): The current versions of what the result depends on.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != versions:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, versions, result):
+        """
+        Store the result of a query, evicting the least recently used entry if the cache is full.
+
+        Parameters:
+        - key (tuple): The query.
+        - versions (tuple): The versions the result was computed at.
+        - result: The result; it is shared with every later hit, so it must not be modified.
+        """
+        self._entries[key] = (versions, result)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry."""
+        self._entries.clear()
+
+    def stats(self):
+        """
+        Return the hit and miss statistics.
+
+        Returns:
+        - dict: The hits, misses, evictions, hit ratio, number of entries and capacity.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries), 'capacity': self.capacity}
+
+
+class Records:
+    """Maintain all the records and the initial amount of money."""
+    """
+    Manage the records and the initial amount of money.
+
+    Attributes:
+    - _store (RecordStore): Column storage of the records, deleted records keep their position.
+    - _balance (int): The current balance, the initial amount of money plus the amounts of all the records,
+      kept up to date by every change.
+    - _debug (bool): If True, the running balance and totals are checked against a full recompute after every change.
+    - _categories_manager (Categories): Instance of the Categories class.
+    - _positions (dict): Maps every category name to an array of the ascending positions of its records.
+    - _totals (dict): Maps every category name to the running total amount of its records, kept up to date by every change.
+    - _counts (dict): Maps every category name to the number of its records still in the list.
+    - _descriptions (dict): Maps every description to an array used as a stack of the positions of its records.
+    - _words (dict): Maps every case-folded word of the descriptions still in the list to the set of those descriptions;
+      None until the first search, then kept up to date by every change.
+    - _word_list (list): The keys of '_words' in sorted order, for prefix searches.
+    - _times (array): Timestamps of the dated records in ascending order.
+    - _time_positions (array): Position in '_store' of the record at the same index of '_times'.
+    - _daily (dict): Maps every category name to a dict of epoch day -> total amount.
+    - _monthly (dict): Maps every category name to a dict of month ('year * 12 + month - 1') -> total amount.
+    - _deleted (int): Number of deleted records still taking a position in '_store'.
+    - _filename (str): The ledger file, 'records.txt' unless given.
+    - _binary (bool): True if the ledger file is a binary snapshot.
+    - _journal (Journal): Log of the changes made since the ledger file was last written.
+    - _storage (Storage): The storage backend that holds the records instead of '_store', None if not used.
+    - _lock (LedgerLock): Lock shared with the other processes working on the same ledger.
+    - _workers (int): Number of processes that parse a text ledger when it is (re)loaded.
+    - _cache (ResultCache): Cache of find and view results, None if caching is off.
+    - _version (int): Incremented by every change of the records or the balance.
+    - _versions (dict): Maps a category name to a counter incremented by every change in its subtree.
+    - _epoch (int): Incremented whenever the indexes are rebuilt, which invalidates every cached result.
+
+    Methods:
+    - add: Add records to the list based on user input.
+    - ingest: Add many (category, description, amount[, date]) rows in validated batches.
+    - ingest_csv: Add the rows of a CSV stream in validated batches.
+    - view: Display all records and report the current balance.
+    - delete: Delete a record based on the provided description.
+    - delete_many: Delete one record for each of the provided descriptions.
+    - find: Display records based on specified categories and report the total amount.
+    - find_records: Return the records under a category and their total amount, optionally within a time range.
+    - search: Display the records whose description has some words, optionally under a category.
+    - search_records: Return the records whose description has some words and their total amount.
+    - records_between: Return the records under a category whose timestamp is within a range.
+    - period_totals: Return the totals of a category subtree over a range of days, month by month.
+    - period: Display the records and monthly totals of a category over a range of days.
+    - rename_category: Rename a category in the tree and in every record of it.
+    - cache_stats: Return the hit and miss statistics of the result cache.
+    - balance: Return the current balance.
+    - category_totals: Return the running total amount of every category.
+    - verify: Check the running balance and totals against a full recompute.
+    - report: Display the balance and the total of every category subtree.
+    - refresh: Apply the changes other processes made to the same ledger.
+    - checkpoint: Fold the journal into the ledger file if it has grown large enough.
+    - save: Save the changes of the session, folding the journal in once it has grown large enough.
+    - compact: Save the current balance and all records to the ledger file and empty the journal.
+    - export_text: Write the ledger in the text format of 'records.txt'.
+    - export_binary: Write the ledger as a binary snapshot.
+    """
+    # Journal size, relative to the number of records, at which 'save' rewrites the ledger file
+    COMPACT_MIN = 1024
+    COMPACT_RATIO = 4
+
+    def __init__(self, categories_manager, filename='records.txt', initial_money=None, workers=1, debug=False,
+                 storage=None, cache_size=128):
+        """
+        Initialize a Records instance.
+
+        Parameters:
+        - categories_manager (Categories): Instance of the Categories class.
+        - filename (str, optional): The ledger file, either text, a binary snapshot or a SQLite database.
+        - initial_money (int, optional): The balance of a new ledger; prompted for if not given.
+        - workers (int, optional): Number of processes that parse a text ledger, 0 for one per CPU.
+        - debug (bool, optional): Check the running balance and totals after every change.
+        - storage (Storage, optional): Keep the records in this backend instead of in memory.
+          A SQLite database is opened as a 'SQLiteStorage' without being given.
+        - cache_size (int, optional): Number of find and view results cached, 0 to turn caching off.
+
+        Raises:
+        - RuntimeError: If the journal holds changes made on top of another version of the ledger file;
+          the journal is set aside, not replayed.
+        """
+        # Instantiate Categories
+        self._store = RecordStore()
+        self._deleted = 0
+        self._initial_money = None
+        self._balance = 0
+        self._debug = debug
+        self._cache = ResultCache(cache_size) if cache_size > 0 else None
+        self._version = 0
+        self._versions = {}
+        self._epoch = 0
+        self._categories_manager = categories_manager
+        self._filename = filename
+        self._binary = False
+        self._journal = Journal(filename + '.journal', filename)
+        self._storage = storage
+        if self._storage is None and SQLiteStorage.is_database(filename):
+            self._storage = SQLiteStorage(filename)
+        if self._storage is not None:
+            self._open_storage(initial_money)
+            return
+        self._lock = LedgerLock(filename + '.lock')
+        self._workers = workers
+        if os.path.exists(filename):
+            print("Welcome back!")
+        try:
+            self._load()
+        except RuntimeError:
+            self._lock.close()
+            raise
+        if self._initial_money is None:
+            # If neither records.txt nor the journal has a balance, prompt for initial balance
+            if initial_money is None:
+                initial_money = get_initial_balance()
+            with self._writing():
+                # Another process may have set it while we were prompting
+                if self._initial_money is None:
+                    self._set_initial_money(initial_money)
+                    self._journal.write_balance(self._initial_money)
+        if self._debug:
+            self.verify()
+
+    @instrumented('records.load')
+    def _load(self):
+        """
+        Read the ledger file, then replay the changes logged since it was written.
+
+        The ledger is read without the lock: it is only ever replaced as a whole, so if it
+        is the same file before and after reading, what was read is consistent. Only the
+        journal is read with the lock held, shared with other readers.
+        """
+        while True:
+            snapshot_id = self._journal._snapshot_id()
+            self._read_ledger()
+            with self._lock.hold(exclusive=False):
+                if self._journal._snapshot_id() == snapshot_id:
+                    self._replay_journal()
+                    return
+            # Another process rewrote the ledger while it was being read
+
+    def _read_ledger(self):
+        """
+        Read the records and the balance of the ledger file into '_store' and rebuild the indexes.
+        """
+        filename = self._filename
+        workers = self._workers
+        self._deleted = 0
+        self._binary = False
+        rejected = 0
+        try:
+            if Snapshot.is_snapshot(filename):
+                # The columns are copied as raw bytes, nothing is parsed
+                with Snapshot(filename) as snapshot:
+                    self._store = RecordStore.from_snapshot(snapshot)
+                    self._initial_money = snapshot.initial_money
+                self._binary = True
+                self._rebuild_index()
+            elif workers != 1:
+                self._store, index, invalid, balance = load_parallel(filename, workers or None)
+                self._initial_money = 0 if balance is None else balance
+                self._rebuild_index(index)
+                rejected = len(invalid)
+                if invalid:
+                    sys.stderr.write(f"Invalid input formats in records.txt:\n")
+                    sys.stderr.write(''.join(f"{line.strip()}\n" for line in invalid))
+            else:
+                #Try to open the file with method
+                with open(filename, 'r') as file:
+                    # Extract records and balance from the file line by line
+                    self._store = RecordStore()
+                    reader = RecordReader(file)
+                    for row in reader:
+                        self._store.append(*row)
+                    self._initial_money = reader.initial_money
+                    rejected = reader.invalid_count
+                    # The indexes are built once, so the time index is sorted in one go
+                    self._rebuild_index()
+        #Exception handling
+        except (FileNotFoundError,RuntimeError,IndexError,ValueError,PermissionError):
+            self._initial_money = None
+            self._store = RecordStore()
+            self._rebuild_index()
+        except Exception as e:
+            sys.stderr.write(f"An unexpected error occurred: {e}\n")
+            sys.stderr.write(f"Initializing with default values.\n")
+            self._initial_money = 0
+            self._store = RecordStore()
+            self._rebuild_index()
+        if METRICS.enabled:
+            METRICS.count('records.load', len(self._store), rejected)
+
+    def _open_storage(self, initial_money):
+        """
+        Start on a storage backend, which needs neither loading nor a journal.
+
+        Parameters:
+        - initial_money (int): The balance of a new ledger; prompted for if None.
+        """
+        # The in-memory indexes stay empty
+        self._rebuild_index()
+        self._initial_money = self._storage.initial_money
+        if self._initial_money is not None:
+            print("Welcome back!")
+        else:
+            if initial_money is None:
+                initial_money = get_initial_balance()
+            self._storage.set_initial_money(initial_money)
+            self._initial_money = initial_money
+        if self._debug:
+            self.verify()
+
+    def _set_initial_money(self, amount):
+        """
+        Replace the initial amount of money, moving the running balance by the difference.
+        """
+        self._balance += amount - (self._initial_money or 0)
+        self._initial_money = amount
+        self._version += 1
+
+    def _touch(self, category):
+        """
+        Mark a category and its ancestors as changed, so the cached results that depend on them go stale.
+        """
+        self._version += 1
+        versions = self._versions
+        parents = self._categories_manager._parent
+        while category is not None:
+            versions[category] = versions.get(category, 0) + 1
+            category = parents.get(category)
+
+    def _cache_versions(self, category=None):
+        """
+        Return the versions a cached result depends on.
+
+        Parameters:
+        - category (str, optional): The root category the result is about, all the records if None.
+        """
+        changes = self._version if category is None else self._versions.get(category, 0)
+        external = self._storage.version() if self._storage is not None else 0
+        return self._epoch, external, self._categories_manager.version, changes
+
+    def cache_stats(self):
+        """
+        Return the hit and miss statistics of the result cache.
+
+        Returns:
+        - dict: The statistics, empty if caching is off.
+        """
+        return self._cache.stats() if self._cache is not None else {}
+
+    def _replay_journal(self):
+        """
+        Apply the operations logged in the journal on top of the loaded records.
+        """
+        self._apply(self._journal.replay())
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """
+        Hold the ledger lock for writing, once the changes of other processes have been applied.
+
+        If another process rewrote the ledger, it is reloaded without the lock and the
+        lock taken again. A storage backend does its own locking.
+        """
+        if self._storage is not None:
+            yield
+            return
+        while True:
+            with self._lock.hold():
+                if self._journal.is_current():
+                    self._apply(self._journal.replay_tail())
+                    self._journal.discard_tail()
+                    yield
+                    return
+            self._load()
+
+    def refresh(self):
+        """
+        Apply the changes other processes made to the same ledger since it was last read or written.
+        """
+        if self._storage is not None:
+            return
+        with self._lock.hold(exclusive=False):
+            if self._journal.is_current():
+                self._apply(self._journal.replay_tail())
+                return
+        self._load()
+
+    def _apply(self, operations):
+        """
+        Apply journal operations on top of the loaded records.
+
+        Parameters:
+        - operations (iterable): Operations as yielded by 'Journal.replay'.
+        """
+        for operation in operations:
+            if operation[0] == 'add':
+                self._append(*operation[1:])
+                self._touch(operation[1])
+            elif operation[0] == 'delete':
+                self._delete_one(operation[1])
+            else:
+                self._set_initial_money(operation[1])
+
+    def _index_record(self, position, category, description, amount, timestamp):
+        """
+        Add a single record to the indexes and rollups, but not to the time index.
+
+        Parameters:
+        - position (int): Position of the record in '_store'.
+        - category (str): The category of the record.
+        - description (str): The description of the record.
+        - amount (int): The amount of the record.
+        - timestamp (int): The timestamp of the record, NO_DATE if unknown.
+        """
+        bucket = self._positions.get(category)
+        if bucket is None:
+            bucket = self._positions[category] = array('q')
+        bucket.append(position)
+        self._totals[category] = self._totals.get(category, 0) + amount
+        self._counts[category] = self._counts.get(category, 0) + 1
+        stack = self._descriptions.get(description)
+        if stack is None:
+            stack = self._descriptions[description] = array('q')
+            if self._words is not None:
+                self._index_words(description)
+        stack.append(position)
+        self._balance += amount
+        if timestamp != NO_DATE:
+            self._roll(category, timestamp, amount)
+
+    def _index_words(self, description):
+        """
+        Add a description that has just got its first record to the word index.
+        """
+        words = self._words
+        for word in description_words(description):
+            descriptions = words.get(word)
+            if descriptions is None:
+                descriptions = words[word] = set()
+                # New words are rare once a ledger is loaded, so the sorted list is kept up to date in place
+                if self._word_list is not None:
+                    insort(self._word_list, word)
+            descriptions.add(description)
+
+    def _unindex_words(self, description):
+        """
+        Remove a description that has lost its last record from the word index.
+        """
+        words = self._words
+        for word in description_words(description):
+            descriptions = words[word]
+            descriptions.discard(description)
+            if not descriptions:
+                del words[word]
+                if self._word_list is not None:
+                    del self._word_list[bisect_left(self._word_list, word)]
+
+    def _roll(self, category, timestamp, amount):
+        """
+        Add an amount to the daily and monthly rollups of a category.
+        """
+        day = timestamp // 86400
+        daily = self._daily.get(category)
+        if daily is None:
+            daily = self._daily[category] = {}
+            self._monthly[category] = {}
+        daily[day] = daily.get(day, 0) + amount
+        monthly = self._monthly[category]
+        month = month_key(day)
+        monthly[month] = monthly.get(month, 0) + amount
+
+    def _append(self, category, description, amount, timestamp=NO_DATE):
+        """
+        Store a record and add it to the indexes.
+        """
+        position = self._store.append(category, description, amount, timestamp)
+        self._index_record(position, category, description, amount, timestamp)
+        if timestamp != NO_DATE:
+            times = self._times
+            # Records mostly arrive in time order, so this is nearly always an append
+            if not times or timestamp >= times[-1]:
+                times.append(timestamp)
+                self._time_positions.append(position)
+            else:
+                index = bisect_left(times, timestamp + 1)
+                times.insert(index, timestamp)
+                self._time_positions.insert(index, position)
+
+    def _rebuild_index(self, index=None):
+        """
+        Rebuild the indexes from scratch, dropping the positions left behind by deleted records.
+
+        Parameters:
+        - index (dict, optional): Indexes of '_store' built by 'load_parallel', taken over instead of walking the rows.
+        """
+        if index is not None:
+            self._deleted = 0
+            self._epoch += 1
+            self._positions = index['positions']
+            self._totals = index['totals']
+            self._counts = index['counts']
+            self._descriptions = index['descriptions']
+            self._words = None
+            self._word_list = None
+            self._daily = index['daily']
+            self._monthly = index['monthly']
+            self._time_positions = index['time_positions']
+            self._times = index['times']
+            self._balance = (self._initial_money or 0) + sum(self._totals.values())
+            return
+        if self._deleted:
+            self._store = self._store.compacted()
+        self._deleted = 0
+        self._epoch += 1
+        self._balance = self._initial_money or 0
+        self._positions = {}
+        self._totals = {}
+        self._counts = {}
+        self._descriptions = {}
+        self._words = None
+        self._word_list = None
+        self._daily = {}
+        self._monthly = {}
+        for position, row in enumerate(self._store.rows()):
+            self._index_record(position, *row)
+        timestamps = self._store.timestamps
+        # A stable sort keeps records with the same timestamp in the order they were added
+        dated = sorted((position for position, timestamp in enumerate(timestamps) if timestamp != NO_DATE),
+                       key=timestamps.__getitem__)
+        self._time_positions = array('q', dated)
+        self._times = array('q', (timestamps[position] for position in dated))
+
+    def _iter_records(self):
+        """
+        Yield (category, description, amount, timestamp) tuples for the records that have not been deleted,
+        in the order they were added.
+        """
+        if self._storage is not None:
+            return self._storage.rows()
+        return self._store.rows()
+
+    def _add_rows(self, rows):
+        """
+        Log and store validated rows.
+
+        Parameters:
+        - rows (list): (category, description, amount, timestamp) tuples.
+
+        Raises:
+        - OverflowError: If the balance or the total of a category subtree would no longer fit in an int64;
+          none of the rows is added then.
+        """
+        for category in {row[0] for row in rows}:
+            self._touch(category)
+        if self._storage is not None:
+            self._storage.add(rows)
+            return
+        with self._writing():
+            self._check_totals(rows)
+            self._journal.write_add(rows)
+            for row in rows:
+                self._append(*row)
+
+    def _check_totals(self, rows):
+        """
+        Check that the balance and the total of every category subtree still fit in an int64 with some rows added.
+
+        Raises:
+        - OverflowError: If a total would not fit.
+        """
+        totals = dict(self._totals)
+        for category, _, amount, _ in rows:
+            totals[category] = totals.get(category, 0) + amount
+        # Adding up the subtrees checks each of their totals
+        self._categories_manager.rollup(totals)
+        checked_sum([self._initial_money or 0, *totals.values()])
+
+    def _delete_one(self, description):
+        """
+        Delete the most recently added record with the given description.
+
+        The row is only marked as deleted so no other position moves. The store is
+        compacted once deleted records take up more than half of it.
+
+        Parameters:
+        - description (str): Description of the record to be deleted.
 
+        Returns:
+        - bool: True if a record was deleted, False if none matched.
+        """
+        stack = self._descriptions.get(description)
+        if not stack:
+            return False
+        position = stack.pop()
+        if not stack:
+            del self._descriptions[description]
+            if self._words is not None:
+                self._unindex_words(description)
+        record = self._store.record(position)
+        category, amount, timestamp = record.category, record.amount, record.timestamp
+        self._store.kill(position)
+        self._deleted += 1
+        # The position stays in its category bucket and the time index and is skipped as a tombstone
+        self._totals[category] -= amount
+        self._counts[category] -= 1
+        self._balance -= amount
+        self._touch(category)
+        if timestamp != NO_DATE:
+            self._roll(category, timestamp, -amount)
+        if self._deleted * 2 > len(self._store):
+            self._rebuild_index()
+        return True
+
+    @instrumented('records.add')
     def add(self, records_input):
         """
         Add records to the list based on user input.
 
+        Records without a date are stamped with the current time.
+
         Parameters:
-        - records_input (str): Input string containing records in 'category description amount' format.
+        - records_input (str): Input string containing records in 'category description amount [date]' format.
         """
-        # Convert the input string into a list of Record instances
         #Test if the user enters multi records with their category, desciption, amount
         records_list = records_input.split(',')
+        added = []
+        rejected = 0
+        now = int(time.time())
 
         for record_string in records_list:
             record_string = record_string.strip()
-            parts = [part.strip() for part in record_string.split()]
             #Check if the entered input of records is valid
-            if len(parts) == 3 and parts[0].isalpha() and parts[1].isalpha() \
-                    and (parts[2].isdigit() or (parts[2][0] == '-' and parts[2][1:].isdigit())):
-                category, description, amount = parts
-                new_record = Record(category, description, int(amount))
-
+            try:
+                record = parse_record(record_string, now)
+            except ValueError as e:
+                sys.stderr.write(f"Invalid record: {record_string} ({e})\n")
+                rejected += 1
+                continue
+            if record is not None:
+                category = record[0]
                 # Check if the category is valid
-                if self._categories_manager.is_category_valid(category, self._categories):
-                    self._records.append(new_record)
+                if self._categories_manager.is_category_valid(category):
+                    added.append(record)
                 else:
                     sys.stderr.write(f"Invalid category: {category}\n")
+                    rejected += 1
             #If the entered input does not match the template, show error message
             else:
                 sys.stderr.write(f"Invalid input format: {record_string}\n")
-                sys.stderr.write(f"Please use 'category description amount' format.\n")
+                sys.stderr.write(f"Please use 'category description amount [date]' format.\n")
+                rejected += 1
+        # Log the whole input with one write
+        try:
+            self._add_rows(added)
+        except OverflowError as e:
+            sys.stderr.write(f"Records not added, {e}\n")
+            rejected += len(added)
+            added = []
+        if METRICS.enabled:
+            METRICS.count('records.add', len(added), rejected)
+        if self._debug:
+            self.verify()
+
+    @instrumented('records.ingest')
+    def ingest(self, rows, chunk_size=10000):
+        """
+        Add many records in batches, without writing anything to stderr.
+
+        Each batch is validated as a whole, logged to the journal as one batch and then added.
+
+        Parameters:
+        - rows (iterable): (category, description, amount) rows with an optional fourth date field;
+          the amount is in whole units like a ledger line, as an int, a 'Decimal' or a decimal string such as '12.50',
+          the date an ISO string or a timestamp.
+          Rows without a date are stamped with the current time.
+        - chunk_size (int, optional): Number of rows per batch.
+
+        Returns:
+        - IngestReport: The number of added records and the rejected rows.
+        """
+        report = IngestReport()
+        # Validation only needs the category names, looked up in the flattened index
+        valid_categories = self._categories_manager._parent
+        rows = iter(rows)
+        number = 0
+        now = int(time.time())
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            batch = []
+            given = []
+            for row in chunk:
+                number += 1
+                try:
+                    category, description, amount, *date = row
+                    category = category.strip()
+                    description = parse_description(description)
+                    amount = amount * AMOUNT_SCALE if isinstance(amount, int) else parse_amount(str(amount))
+                    if len(date) > 1 or not INT64_MIN <= amount <= INT64_MAX:
+                        raise ValueError
+                except (ValueError, TypeError, AttributeError):
+                    report.reject(number, row, "invalid format")
+                    continue
+                if not date:
+                    timestamp = now
+                elif isinstance(date[0], int):
+                    timestamp = date[0]
+                else:
+                    try:
+                        timestamp = parse_timestamp(date[0].strip())
+                    except (ValueError, TypeError, AttributeError):
+                        report.reject(number, row, "invalid date")
+                        continue
+                if not category.isalpha():
+                    report.reject(number, row, "invalid format")
+                elif category not in valid_categories:
+                    report.reject(number, row, "invalid category")
+                else:
+                    batch.append((category, description, amount, timestamp))
+                    given.append((number, row))
+            try:
+                self._add_rows(batch)
+            except OverflowError:
+                # Nothing of the batch was added
+                for rejected in given:
+                    report.reject(*rejected, "total out of range")
+                continue
+            report.added += len(batch)
+        if METRICS.enabled:
+            METRICS.count('records.ingest', report.added, len(report.errors))
+        if self._debug:
+            self.verify()
+        return report
+
+    def ingest_csv(self, file, chunk_size=10000):
+        """
+        Add the rows of a CSV stream with 'category,description,amount' columns and an optional 'date' column.
+
+        A header row with those names is skipped and blank rows are ignored.
+
+        Parameters:
+        - file (file): An open text file or any iterable of CSV lines.
+        - chunk_size (int, optional): Number of rows per batch.
+
+        Returns:
+        - IngestReport: The number of added records and the rejected rows.
+        """
+        def data_rows():
+            for row in csv.reader(file):
+                if not row:
+                    continue
+                if [field.strip().lower() for field in row] in (['category', 'description', 'amount'],
+                                                                ['category', 'description', 'amount', 'date']):
+                    continue
+                yield row
+        return self.ingest(data_rows(), chunk_size)
 
-    def view(self):
+    def view(self, **options):
         """
         Display all records and report the current balance.
+
+        Parameters:
+        - options: The display options of '_show'.
         """
-        # Print all the records and report the balance
-        total_amount = 0
-        print(f"{'Category':<15} {'Description':<20} {'Amount'}")
-        print("=" * 55)
-        for record in self._records:
-            #Filter the data to their respective fields
-            category = record.category
-            desc = record.description
-            amt = record.amount
-            total_amount += amt
-            print(f"{category:<15} {desc:<20} {amt}")
-        print("=" * 55)
-        #calculate the balance
-        print(f"Now you have {self._initial_money + total_amount} dollars.")
+        self._show(('view',), self._cache_versions(), self._iter_records,
+                   f"Now you have {format_amount(self.balance())} dollars.", {'balance': self.balance()}, 55,
+                   **options)
 
+    def _show(self, key, versions, rows, footer, summary, width, output_format='table', offset=0, limit=None,
+              top=None, bottom=None, page_size=0, out=None):
+        """
+        Render rows and write them in large chunks, or a page at a time.
+
+        The rendered chunks are cached until the rows they come from change.
+
+        Parameters:
+        - key (tuple): The query, for the cache.
+        - versions (tuple): The versions the rows depend on, for the cache.
+        - rows (callable): Returns the rows when they have to be rendered.
+        - footer (str or callable): Line under a table, or a function that returns it given the total amount
+          of the displayed rows.
+        - summary (dict or callable): Keys after the records of a JSON object, or a function that returns them
+          given the total amount of the displayed rows.
+        - width (int): Width of the rules around a table.
+        - output_format (str, optional): 'table', 'csv' or 'json'.
+        - offset, limit, top, bottom (int, optional): Which rows to display, see 'select_rows'.
+        - page_size (int, optional): Rows per page, each page waiting for Enter; 0 for no pages.
+        - out (file, optional): Where the output goes, stdout unless given.
+        """
+        if out is None:
+            out = sys.stdout
+        key += (output_format, offset, limit, top, bottom, page_size)
+        chunks = self._cache.get(key, versions) if self._cache is not None else None
+        if chunks is None:
+            selected = select_rows(rows(), offset, limit, top, bottom)
+            if callable(footer):
+                # The options may have left out some rows, so the total is of the ones displayed
+                selected = list(selected)
+                total = checked_sum(row[2] for row in selected)
+                footer, summary = footer(total), summary(total)
+            chunks = tuple(render_rows(selected, output_format, footer, summary, width, page_size or 4096))
+            if self._cache is not None:
+                self._cache.put(key, versions, chunks)
+        last = len(chunks) - 1
+        for index, chunk in enumerate(chunks):
+            out.write(chunk)
+            # The first and last chunks are the head and the tail, a page ends after each chunk of rows but the last
+            if page_size and 0 < index < last - 1:
+                out.flush()
+                if input("-- more (Enter to continue, q to stop) --").strip() == 'q':
+                    out.write(chunks[last])
+                    break
+        out.flush()
+
+    def balance(self):
+        """
+        Return the current balance, kept up to date by every change.
+
+        Returns:
+        - int: The initial amount of money plus the amounts of all the records.
+        """
+        if self._storage is not None:
+            return self._storage.balance()
+        return self._balance
+
+    def category_totals(self):
+        """
+        Return the running total amount of every category.
+
+        Returns:
+        - dict: Maps every category that has records to the total amount of its records.
+        """
+        if self._storage is not None:
+            return self._storage.category_totals()
+        return {category: total for category, total in self._totals.items() if self._counts[category]}
+
+    def verify(self):
+        """
+        Recompute the balance and the category totals from the amount column and compare
+        them with the running values, reporting every mismatch to stderr.
+
+        Returns:
+        - bool: True if everything matches.
+        """
+        if self._storage is not None:
+            return self._storage.verify()
+        store = self._store
+        consistent = True
+        expected = self._initial_money + store.total()
+        if self._balance != expected:
+            sys.stderr.write(f"Balance mismatch: running {format_amount(self._balance)}, "
+                             f"recomputed {format_amount(expected)}\n")
+            consistent = False
+        for category, bucket in self._positions.items():
+            expected = store.total_at(bucket)
+            if self._totals[category] != expected:
+                sys.stderr.write(f"Total mismatch for {category}: running {format_amount(self._totals[category])}, "
+                                 f"recomputed {format_amount(expected)}\n")
+                consistent = False
+        return consistent
+
+    def report(self):
+        """
+        Display the balance and the total of every category subtree.
+        """
+        categories_manager = self._categories_manager
+        rolled = categories_manager.rollup(self.category_totals())
+        print(f"{'Category':<25} {'Total'}")
+        print("=" * 40)
+        for name in categories_manager._order:
+            print(f"{' ' * (categories_manager.depth(name) * 2) + name:<25} {format_amount(rolled[name])}")
+        print("=" * 40)
+        print(f"Now you have {format_amount(self.balance())} dollars.")
+
+    @instrumented('records.delete')
     def delete(self, description):
         """
         Delete a record based on the provided description.
@@ -262,91 +3291,890 @@ class Records:
         - description (str): Description of the record to be deleted.
         """
         try:
-            #Reverse the string for the method to delete the last entered duplicate
-            found = False
-            last_index = -1
-            # Check if there is something to delete
-            for i, record in enumerate(self._records):
-                desc = record.description  # Access the description using attribute
-                if desc == description:
-                    found = True
-                    last_index = i
-            # If found, delete that data
-            if found:
-                category = self._records[last_index].category
-                amt = self._records[last_index].amount
-                self._balance -= amt
-                del self._records[last_index]
+            if self._storage is not None:
+                deleted = not self._storage.delete([description])
+                # The category of the deleted row is not known here
+                self._epoch += 1
+            else:
+                with self._writing():
+                    # The last entered duplicate sits on top of the description's stack
+                    deleted = self._delete_one(description)
+                    if deleted:
+                        self._journal.write_delete([description])
+            if deleted:
                 print(f"Record with description '{description}' deleted successfully.")
+                if self._debug:
+                    self.verify()
             #Prompted delete record is not found
             else:
                 print("Record not found.")
         #Exception for somewhat reason if the delete function does not work
         except Exception as e:
             sys.stderr.write(f"An error occurred when trying to Delete Records: {e}\n")
-    
-    def find(self, categories_to_find):
+
+    @instrumented('records.delete_many')
+    def delete_many(self, descriptions):
+        """
+        Delete one record for each of the provided descriptions.
+
+        A description listed twice deletes its two most recently added records.
+
+        Parameters:
+        - descriptions (iterable): Descriptions of the records to be deleted.
+
+        Returns:
+        - list: The descriptions that did not match any record.
+        """
+        if self._storage is not None:
+            descriptions = list(descriptions)
+            not_found = self._storage.delete(descriptions)
+            self._epoch += 1
+            if METRICS.enabled:
+                METRICS.count('records.delete_many', len(descriptions) - len(not_found), len(not_found))
+            if self._debug:
+                self.verify()
+            return not_found
+        not_found = []
+        deleted = []
+        with self._writing():
+            try:
+                for description in descriptions:
+                    if self._delete_one(description):
+                        deleted.append(description)
+                    else:
+                        not_found.append(description)
+            except Exception as e:
+                sys.stderr.write(f"An error occurred when trying to Delete Records: {e}\n")
+            self._journal.write_delete(deleted)
+        if METRICS.enabled:
+            METRICS.count('records.delete_many', len(deleted), len(not_found))
+        if self._debug:
+            self.verify()
+        return not_found
+
+    def find(self, categories_to_find, **options):
         """
         Display records based on specified categories and report the total amount.
 
         Parameters:
-        - categories_to_find (str): Comma-separated categories to search for.
+        - categories_to_find (str): The root category of the search.
+        - options: The display options of '_show'.
         """
         # Print the records whose category is in the list passed in
         # and report the total amount of money of the listed records.
-        subcategories = self._categories_manager.find_categories(categories_to_find)
-        filtered_records = [record for record in self._records if record.category in subcategories or
-                            any(subcategory in record.category for subcategory in subcategories)]
+        found, _ = self.find_records(categories_to_find)
         #If the prompted record is not found
-        if not filtered_records:
+        if not found:
             print(f"No records found for the specified categories.")
             return
-        #Print out the found categories
-        current_money = 0
-        print(f"{'Category':<15} {'Description':<20} {'Amount'}")
-        dash = '=' * 40
-        print(dash)
-        #Print out the amount
-        for record in filtered_records:
-            print(f"{record.category:<15} {record.description:<20} {record.amount}")
-            current_money += int(record.amount)
+        self._show(('find_text', categories_to_find), self._cache_versions(categories_to_find), lambda: found,
+                   lambda total: f'The total amount above is {format_amount(total)} dollars.',
+                   lambda total: {'total': total}, 40, **options)
+
+    @instrumented('records.find')
+    def find_records(self, category, start=None, end=None):
+        """
+        Return the records under a category and their total amount.
+
+        Parameters:
+        - category (str): The root category of the search.
+        - start (int, optional): Only keep records with a timestamp at or after this one.
+        - end (int, optional): Only keep records with a timestamp before this one.
+
+        Returns:
+        - tuple: A list of (category, description, amount, timestamp) tuples, in the order they were added
+          or in time order if a range is given, and the total amount of those records.
+          The result may be shared with later calls through the cache and must not be modified.
+        """
+        versions = self._cache_versions(category)
+        key = ('find', category, start, end)
+        if self._cache is not None:
+            result = self._cache.get(key, versions)
+            if result is None:
+                result = self._find_records(category, start, end)
+                self._cache.put(key, versions, result)
+            return result
+        return self._find_records(category, start, end)
+
+    def _find_records(self, category, start, end):
+        """
+        Return the records under a category and their total amount, without the cache.
+        """
+        if start is not None or end is not None:
+            found = self.records_between(category, start, end)
+            return found, checked_sum(row[2] for row in found)
+        subcategories = self._categories_manager.subtree(category)
+        if self._storage is not None:
+            # The rows and their total are both found by the database
+            return self._storage.find(subcategories), self._storage.total(subcategories)
+        # Only the buckets of the subtree are touched, merged back into ledger order
+        buckets = [self._positions[name] for name in subcategories if self._counts.get(name)]
+        total = checked_sum(self._totals[name] for name in subcategories if name in self._totals)
+        store = self._store
+        found = [store.row(position) for position in merge(*buckets) if store.is_live(position)]
+        return found, total
+
+    @instrumented('records.records_between')
+    def records_between(self, category, start=None, end=None):
+        """
+        Return the dated records under a category with a timestamp in '[start, end)'.
+
+        The range is found by bisecting the time index, so only the records inside it are visited.
+
+        Parameters:
+        - category (str): The root category of the search.
+        - start (int, optional): First timestamp of the range, unbounded if None.
+        - end (int, optional): Timestamp just after the range, unbounded if None.
+
+        Returns:
+        - list: (category, description, amount, timestamp) tuples in time order.
+        """
+        subcategories = self._categories_manager.subtree(category)
+        if self._storage is not None:
+            # Some bound is given even for an unbounded range, so the undated records are left out
+            return self._storage.find(subcategories, NO_DATE + 1 if start is None else start, end)
+        times = self._times
+        low = 0 if start is None else bisect_left(times, start)
+        high = len(times) if end is None else bisect_left(times, end)
+        store = self._store
+        names = store._names
+        found = []
+        for position in self._time_positions[low:high]:
+            code = store.categories[position]
+            if code != store.DELETED and names[code] in subcategories:
+                found.append(store.row(position))
+        return found
+
+    def search(self, query, category=None, **options):
+        """
+        Display the records whose description has every word of a query and report their total amount.
+
+        Parameters:
+        - query (str): The words to search for; a word ending with '*' is a prefix.
+        - category (str, optional): Only search the records under this category.
+        - options: The display options of '_show'.
+        """
+        try:
+            terms = parse_search(query)
+        except ValueError as e:
+            sys.stderr.write(f"Invalid search: {e}\n")
+            return
+        found, _ = self.search_records(terms, category)
+        if not found:
+            print(f"No records found for the specified words.")
+            return
+        self._show(('search_text', terms, category), self._cache_versions(category), lambda: found,
+                   lambda total: f'The total amount above is {format_amount(total)} dollars.',
+                   lambda total: {'total': total}, 40, **options)
+
+    @instrumented('records.search')
+    def search_records(self, terms, category=None):
+        """
+        Return the records whose description has every one of some words, and their total amount.
 
-        print(dash)
-        print(f'The total amount above is {current_money} dollars.')
+        The words are looked up in the inverted word index, so only the matching records are visited.
 
+        Parameters:
+        - terms (tuple): Case-folded words as returned by 'parse_search'.
+        - category (str, optional): Only keep the records in the subtree of this category.
+
+        Returns:
+        - tuple: A list of (category, description, amount, timestamp) tuples in the order they were added,
+          and the total amount of those records. The result may be shared with later calls through the cache
+          and must not be modified.
+        """
+        versions = self._cache_versions(category)
+        key = ('search', terms, category)
+        if self._cache is not None:
+            result = self._cache.get(key, versions)
+            if result is None:
+                result = self._search_records(terms, category)
+                self._cache.put(key, versions, result)
+            return result
+        return self._search_records(terms, category)
+
+    def _search_records(self, terms, category):
+        """
+        Return the records matching a search and their total amount, without the cache.
+        """
+        subcategories = None if category is None else self._categories_manager.subtree(category)
+        if self._storage is not None:
+            found = self._storage.search(terms, subcategories)
+            return found, checked_sum(row[2] for row in found)
+        if self._words is None:
+            # Built from the distinct descriptions on the first search, so loading a ledger does not pay for it
+            self._words = {}
+            for description in self._descriptions:
+                self._index_words(description)
+        matched = None
+        for term in terms:
+            if term.endswith('*'):
+                prefix = term[:-1]
+                if self._word_list is None:
+                    self._word_list = sorted(self._words)
+                word_list = self._word_list
+                descriptions = set()
+                for index in range(bisect_left(word_list, prefix), len(word_list)):
+                    if not word_list[index].startswith(prefix):
+                        break
+                    descriptions |= self._words[word_list[index]]
+            else:
+                descriptions = self._words.get(term, frozenset())
+            matched = descriptions if matched is None else matched & descriptions
+            if not matched:
+                return [], 0
+        store = self._store
+        # The description stacks only hold live positions, sorting them back gives ledger order
+        positions = sorted(chain.from_iterable(self._descriptions[description] for description in matched))
+        if subcategories is not None:
+            codes = {store._codes[name] for name in subcategories if name in store._codes}
+            categories = store.categories
+            positions = [position for position in positions if categories[position] in codes]
+        found = [store.row(position) for position in positions]
+        return found, checked_sum(row[2] for row in found)
+
+    @instrumented('records.period_totals')
+    def period_totals(self, category, first_day, last_day):
+        """
+        Return the totals of a category subtree over a range of days, month by month.
+
+        Whole months are read from the monthly rollups and only the days of the partial
+        months at either end from the daily rollups.
+
+        Parameters:
+        - category (str): The root category.
+        - first_day (int): First day of the range, in days since 1970-01-01.
+        - last_day (int): Last day of the range, included.
+
+        Returns:
+        - list: (month, total) tuples in order, the month as 'year * 12 + month - 1'.
+        """
+        if self._storage is not None:
+            totals = self._storage.month_totals(self._categories_manager.subtree(category),
+                                                first_day * 86400, (last_day + 1) * 86400)
+            return [(month, totals.get(month, 0)) for month in range(month_key(first_day), month_key(last_day) + 1)]
+        subcategories = [name for name in self._categories_manager.subtree(category) if name in self._daily]
+        months = []
+        day = first_day
+        while day <= last_day:
+            month = month_key(day)
+            next_month = month_first_day(month + 1)
+            if day == month_first_day(month) and next_month - 1 <= last_day:
+                total = checked_sum(self._monthly[name].get(month, 0) for name in subcategories)
+            else:
+                days = range(day, min(next_month - 1, last_day) + 1)
+                total = checked_sum(self._daily[name].get(each, 0) for name in subcategories for each in days)
+            months.append((month, total))
+            day = next_month
+        return months
+
+    def period(self, category, first_day, last_day):
+        """
+        Display the records and monthly totals of a category subtree over a range of days.
+
+        Parameters:
+        - category (str): The root category.
+        - first_day (int): First day of the range, in days since 1970-01-01.
+        - last_day (int): Last day of the range, included.
+        """
+        found = self.records_between(category, first_day * 86400, (last_day + 1) * 86400)
+        print(f"{'Date':<20} {'Category':<15} {'Description':<20} {'Amount'}")
+        print("=" * 65)
+        for category_name, desc, amt, timestamp in found:
+            print(f"{format_timestamp(timestamp):<20} {category_name:<15} {desc:<20} {format_amount(amt)}")
+        print("=" * 65)
+        months = self.period_totals(category, first_day, last_day)
+        for month, total in months:
+            print(f"{month // 12:04d}-{month % 12 + 1:02d} {format_amount(total)}")
+        print(f'The total amount above is {format_amount(checked_sum(total for _, total in months))} dollars.')
+
+    def rename_category(self, old, new):
+        """
+        Rename a category in the category tree and in every record of it.
+
+        The ledger file is rewritten with the new name, since the records logged in the
+        journal and written in the ledger name their category.
+
+        Parameters:
+        - old (str): The current name.
+        - new (str): The new name.
+
+        Raises:
+        - ValueError: If the old name does not exist, or the new one is taken or invalid.
+        """
+        self._categories_manager.rename(old, new)
+        if self._storage is not None:
+            self._storage.rename_category(old, new)
+            self._epoch += 1
+            return
+        with self._writing():
+            store = self._store
+            code = store.intern(new)
+            for position in self._positions.get(old, ()):
+                if store.is_live(position):
+                    store.categories[position] = code
+            self._rebuild_index()
+            # Rewritten without a message, so scripted output stays machine-readable
+            self._rewrite()
+
+    @instrumented('records.save')
     def save(self):
         """
-        Save the current balance and all records to 'records.txt'.
+        Save the changes of the session.
+
+        Every change is already in the journal, so the ledger file is only rewritten
+        once the journal has grown large compared to the ledger. A storage backend
+        already holds every change and is closed.
+        """
+        if self._storage is not None:
+            self._storage.close()
+            print(f"Records saved to {self._filename}")
+            return
+        if not self.checkpoint():
+            self._journal.close()
+            self._lock.close()
+            print(f"Records saved to {self._journal._filename}")
+
+    def checkpoint(self):
+        """
+        Fold the journal into the ledger file if it has grown large compared to the ledger.
+
+        Returns:
+        - bool: True if the ledger file was rewritten.
+        """
+        if self._storage is not None:
+            return False
+        live = len(self._store) - self._deleted
+        if self._journal.count >= max(self.COMPACT_MIN, live // self.COMPACT_RATIO):
+            self.compact()
+            return True
+        return False
+
+    @instrumented('records.compact')
+    def compact(self):
+        """
+        Save the current balance and all records to the ledger file and empty the journal.
         """
-        # Save the balance money and all the records to 'records.txt'.
+        if self._storage is not None:
+            # Every change is already committed to the storage backend
+            return
+        # Save the balance money and all the records, in the format the ledger was read in.
         try:
-            with open('records.txt', 'w') as file:
-                for record in self._records:
-                    file.write(f"{record.category} {record.description} {record.amount}\n")
-                file.write(f"Balance: {self._initial_money}\n")
-            print("Records saved to records.txt")
+            # The records other processes logged are merged in before the ledger is rewritten
+            with self._writing():
+                self._rewrite()
+            print(f"Records saved to {self._filename}")
         except Exception as e:
             sys.stderr.write(f"An error occurred when trying to save records: {e}\n")
 
+    def _rewrite(self):
+        """
+        Write all records to the ledger file, in the format it was read in, and empty the journal.
+
+        The caller holds the ledger lock for writing.
+        """
+        if self._binary:
+            self.export_binary(self._filename)
+        else:
+            self.export_text(self._filename)
+        self._journal.restart()
+
+    def export_text(self, filename):
+        """
+        Write the current balance and all records in the text format of 'records.txt'.
+
+        Parameters:
+        - filename (str): The file to write.
+        """
+        # Write a new file and swap it in, so a crash never leaves a half-written ledger
+        with open(filename + '.tmp', 'w') as file:
+            for category, desc, amt, timestamp in self._iter_records():
+                if timestamp != NO_DATE:
+                    file.write(f"{category} {desc} {format_amount(amt)} {format_timestamp(timestamp)}\n")
+                else:
+                    file.write(f"{category} {desc} {format_amount(amt)}\n")
+            file.write(f"Balance: {format_amount(self._initial_money)}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(filename + '.tmp', filename)
+
+    def export_binary(self, filename):
+        """
+        Write the current balance and all records as a binary snapshot.
+
+        Parameters:
+        - filename (str): The file to write.
+        """
+        store = self._store
+        if self._storage is not None:
+            store = RecordStore()
+            for row in self._storage.rows():
+                store.append(*row)
+        with open(filename + '.tmp', 'wb') as file:
+            Snapshot.write(file, store, self._initial_money)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(filename + '.tmp', filename)
+
 
 def get_initial_balance():
     """
     Prompt the user for the initial balance and return the entered value.
 
-    The function attempts to convert the user input to an integer.
-    If the input is not a valid integer, it defaults to 0 and displays an error message.
+    The function attempts to convert the user input to an amount, which may have cents.
+    If the input is not a valid amount, it defaults to 0 and displays an error message.
 
     Returns:
-    int: The initial balance entered by the user.
+    int: The initial balance entered by the user, in cents.
     """
     try:
-        balance = int(input('How much money do you have?\n'))
+        balance = parse_amount(input('How much money do you have?\n'))
     except (ValueError, TypeError):
         sys.stderr.write(f"Invalid input. Initializing balance to 0.\n")
         balance = 0
     return balance
 
 
+def run_command(records_manager, line, options=None):
+    """
+    Run one scripted command and return its result as a dict.
+
+    Commands take their arguments on the same line:
+    'add category description amount [date], ...', 'delete description, ...', 'find category',
+    'search [category:] word [prefix*] ...',
+    'period category first_date last_date', 'view', 'balance', 'report',
+    'category add name [parent]|rename old new|move name [parent]', 'categories', 'cache' and
+    'metrics on|off|json|prometheus|reset'.
+
+    Parameters:
+    - records_manager (Records): The ledger to work on.
+    - line (str): The command line.
+    - options (dict, optional): 'offset', 'limit', 'top' and 'bottom' applied to the listed records,
+      see 'select_rows'; the total of 'find' and 'search' is then the total of the listed records.
+
+    Returns:
+    - dict: The result of the command; it has an 'error' key if the command failed.
+    """
+    command, _, argument = line.strip().partition(' ')
+    argument = argument.strip()
+    result = {'command': command}
+    if command == 'add':
+        report = records_manager.ingest(parse_add_argument(argument))
+        result['added'] = report.added
+        result['errors'] = [{'row': number, 'input': ' '.join(row), 'reason': reason}
+                            for number, row, reason in report.errors]
+    elif command == 'delete':
+        # Descriptions are kept with single spaces between their words
+        descriptions = [' '.join(description.split()) for description in argument.split(',') if description.strip()]
+        not_found = records_manager.delete_many(descriptions)
+        result['deleted'] = len(descriptions) - len(not_found)
+        result['not_found'] = not_found
+    elif command == 'find':
+        found, total = records_manager.find_records(argument)
+        result['category'] = argument
+        result['records'] = found
+        result['total'] = total
+    elif command == 'search':
+        category, _, query = argument.rpartition(':')
+        try:
+            terms = parse_search(query)
+        except ValueError as e:
+            result['error'] = f"{e}; usage: search [category:] word [prefix*] ..."
+            return result
+        found, total = records_manager.search_records(terms, category.strip() or None)
+        result['category'] = category.strip() or None
+        result['words'] = list(terms)
+        result['records'] = found
+        result['total'] = total
+    elif command == 'period':
+        try:
+            category, first, last = argument.split()
+            first_day = parse_timestamp(first) // 86400
+            last_day = parse_timestamp(last) // 86400
+        except ValueError:
+            result['error'] = "usage: period category first_date last_date"
+            return result
+        months = records_manager.period_totals(category, first_day, last_day)
+        result['category'] = category
+        result['records'] = records_manager.records_between(category, first_day * 86400, (last_day + 1) * 86400)
+        result['months'] = {f"{month // 12:04d}-{month % 12 + 1:02d}": total for month, total in months}
+        result['total'] = checked_sum(total for _, total in months)
+    elif command == 'view':
+        result['records'] = list(records_manager._iter_records())
+        result['balance'] = records_manager.balance()
+    elif command == 'balance':
+        result['balance'] = records_manager.balance()
+    elif command == 'category':
+        try:
+            edit_category(records_manager, argument)
+        except ValueError as e:
+            result['error'] = str(e)
+            return result
+        result['categories'] = records_manager._categories_manager._categories
+    elif command == 'categories':
+        result['categories'] = records_manager._categories_manager._categories
+    elif command == 'cache':
+        result['cache'] = records_manager.cache_stats()
+    elif command == 'metrics':
+        if argument in ('on', 'off'):
+            METRICS.enabled = argument == 'on'
+            result['enabled'] = METRICS.enabled
+        elif argument == 'reset':
+            METRICS.reset()
+        elif argument == 'prometheus':
+            result['text'] = METRICS.to_prometheus()
+        elif argument in ('', 'json'):
+            result['metrics'] = METRICS.to_dict()
+        else:
+            result['error'] = "usage: metrics on|off|json|prometheus|reset"
+    elif command == 'report':
+        categories_manager = records_manager._categories_manager
+        rolled = categories_manager.rollup(records_manager.category_totals())
+        result['totals'] = {name: rolled[name] for name in categories_manager._order}
+        result['balance'] = records_manager.balance()
+    else:
+        result['error'] = f"invalid command: {command}"
+    if options and 'records' in result:
+        result['records'] = list(select_rows(result['records'], **options))
+        if command in ('find', 'search'):
+            # The total is of the listed records, as under the table of 'find'
+            result['total'] = checked_sum(row[2] for row in result['records'])
+    return result
+
+
+def edit_category(records_manager, argument):
+    """
+    Apply one edit of the category tree: 'add name [parent]', 'rename old new' or 'move name [parent]'.
+
+    Parameters:
+    - records_manager (Records): The ledger whose category tree is edited.
+    - argument (str): The edit.
+
+    Raises:
+    - ValueError: If the edit is malformed or cannot be applied.
+    """
+    action, *names = argument.split() or ['']
+    if action == 'add' and len(names) in (1, 2):
+        records_manager._categories_manager.add(*names)
+    elif action == 'move' and len(names) in (1, 2):
+        records_manager._categories_manager.move(*names)
+    elif action == 'rename' and len(names) == 2:
+        records_manager.rename_category(*names)
+    else:
+        raise ValueError("usage: category add name [parent] | rename old new | move name [parent]")
+
+
+def parse_add_argument(argument):
+    """
+    Split the argument of an 'add' command into rows of fields.
+
+    Parameters:
+    - argument (str): 'category description amount [date], ...'.
+
+    Returns:
+    - list: The rows, one list of fields per comma-separated item; an item that is not a record
+      is split on whitespace and rejected by 'Records.ingest'.
+    """
+    return [split_record(item) or item.split() for item in argument.split(',') if item.strip()]
+
+
+def run_batch(records_manager, lines, options=None):
+    """
+    Run a batch of command lines and return their results in order.
+
+    Consecutive 'add' commands are ingested together, so they reach the journal as one write;
+    their rejected rows are numbered within their own command as 'run_command' does.
+    A command that raises gets an 'error' result instead of ending the batch.
+
+    Parameters:
+    - records_manager (Records): The ledger to work on.
+    - lines (iterable): The command lines; blank lines and lines starting with '#' are skipped.
+    - options (dict, optional): Which listed records are kept, see 'run_command'.
+
+    Returns:
+    - list: The result dict of every command.
+    """
+    results = []
+    pending = []
+
+    def flush_adds():
+        rows = []
+        for result, command_rows in pending:
+            result['added'] = len(command_rows)
+            result['errors'] = []
+            rows += command_rows
+        try:
+            report = records_manager.ingest(rows)
+        except Exception as e:
+            # Batches ingested before the failure stay added, which the error says
+            for result, _ in pending:
+                result.clear()
+                result.update(command='add', error=f"{type(e).__name__}: {e}; earlier rows of the batch may be added")
+            pending.clear()
+            return
+        # Map the row numbers of the whole batch back to their command
+        first_rows = [0]
+        for _, command_rows in pending:
+            first_rows.append(first_rows[-1] + len(command_rows))
+        index = 0
+        for number, row, reason in report.errors:
+            while number > first_rows[index + 1]:
+                index += 1
+            result = pending[index][0]
+            result['added'] -= 1
+            result['errors'].append({'row': number - first_rows[index], 'input': ' '.join(row), 'reason': reason})
+        pending.clear()
+
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        command, _, argument = line.strip().partition(' ')
+        if command == 'add':
+            result = {'command': command}
+            results.append(result)
+            pending.append((result, parse_add_argument(argument.strip())))
+            continue
+        if pending:
+            flush_adds()
+        # A failing command gets an error result, so every line still gets its answer
+        try:
+            results.append(run_command(records_manager, line, options))
+        except Exception as e:
+            results.append({'command': command, 'error': f"{type(e).__name__}: {e}"})
+    if pending:
+        flush_adds()
+    return results
+
+
+def format_tsv(result):
+    """
+    Format a command result as tab-separated lines, each starting with its kind.
+
+    Parameters:
+    - result (dict): A result of 'run_command'.
+
+    Returns:
+    - str: The lines, each ending with a newline.
+    """
+    if 'error' in result:
+        return f"error\t{result['command']}\t{result['error']}\n"
+    lines = []
+    command = result['command']
+    if command == 'add':
+        lines.append(f"added\t{result['added']}")
+        lines += [f"rejected\t{error['row']}\t{error['reason']}\t{error['input']}" for error in result['errors']]
+    elif command == 'delete':
+        lines.append(f"deleted\t{result['deleted']}")
+        lines += [f"not_found\t{description}" for description in result['not_found']]
+    elif command == 'report':
+        lines += [f"category\t{name}\t{format_amount(total)}" for name, total in result['totals'].items()]
+    elif command == 'period':
+        lines += [f"month\t{month}\t{format_amount(total)}" for month, total in result['months'].items()]
+    elif command == 'cache':
+        lines += [f"cache\t{key}\t{value}" for key, value in result['cache'].items()]
+    elif command in ('category', 'categories'):
+        def walk(categories, parent):
+            last = None
+            for item in categories:
+                if isinstance(item, list):
+                    walk(item, last)
+                else:
+                    lines.append(f"category\t{item}\t{parent or ''}")
+                    last = item
+        walk(result['categories'], None)
+    elif command == 'metrics':
+        if 'text' in result:
+            return result['text']
+        lines += [f"metric\t{name}\t{key}\t{value}" for name, values in result.get('metrics', {}).items()
+                  for key, value in values.items() if key != 'histogram']
+    lines += [f"record\t{category}\t{desc}\t{format_amount(amt)}\t{format_timestamp(timestamp)}"
+              for category, desc, amt, timestamp in result.get('records', ())]
+    if 'total' in result:
+        lines.append(f"total\t{format_amount(result['total'])}")
+    if 'balance' in result:
+        lines.append(f"balance\t{format_amount(result['balance'])}")
+    return ''.join(line + '\n' for line in lines)
+
+
+def format_json(result):
+    """
+    Format a command result as one JSON line, with the amounts as decimal strings such as "-12.50".
+
+    A JSON number is read as a double by most clients, which is not exact past 2**53 minor units.
+    A record without a date has a null timestamp.
+
+    Parameters:
+    - result (dict): A result of 'run_command', its amounts in cents.
+
+    Returns:
+    - str: The line, ending with a newline.
+    """
+    result = dict(result)
+    if 'records' in result:
+        result['records'] = [(category, desc, format_amount(amt), None if timestamp == NO_DATE else timestamp)
+                             for category, desc, amt, timestamp in result['records']]
+    for key in ('totals', 'months'):
+        if key in result:
+            result[key] = {name: format_amount(total) for name, total in result[key].items()}
+    for key in ('total', 'balance'):
+        if key in result:
+            result[key] = format_amount(result[key])
+    return json.dumps(result) + '\n'
+
+
+def run_script(records_manager, lines, output_format='json', out=None, options=None):
+    """
+    Run scripted commands in a loop and write machine-readable results.
+
+    Blank lines and lines starting with '#' are skipped. Commands are run in blocks of
+    'run_batch', and their results written per block, one JSON object per line or
+    tab-separated lines, to keep the number of writes low.
+
+    Parameters:
+    - records_manager (Records): The ledger to work on.
+    - lines (iterable): The command lines.
+    - output_format (str, optional): 'json' or 'tsv'.
+    - out (file, optional): Where the results go, stdout unless given.
+    - options (dict, optional): Which listed records are kept, see 'run_command'.
+
+    Returns:
+    - int: The number of commands that failed, rejected some of their rows or did not find
+      a description to delete.
+    """
+    if out is None:
+        out = sys.stdout
+    failures = 0
+    lines = iter(lines)
+    while True:
+        block = list(islice(lines, 1024))
+        if not block:
+            break
+        results = run_batch(records_manager, block, options)
+        # A partial import or delete counts too, so a scheduled run can tell from the exit status
+        failures += sum('error' in result or bool(result.get('errors')) or bool(result.get('not_found'))
+                        for result in results)
+        if output_format == 'tsv':
+            out.write(''.join(map(format_tsv, results)))
+        else:
+            out.write(''.join(map(format_json, results)))
+    out.flush()
+    return failures
+
+
+def stream_ledger(categories_manager, filename, category=None):
+    """
+    Display the records of a ledger while reading it, for '--stream-view' and '--stream-find'.
+
+    A text ledger is parsed line by line; a binary snapshot is viewed through its memory map, without copying the columns.
+
+    Parameters:
+    - categories_manager (Categories): Instance of the Categories class.
+    - filename (str): The ledger file.
+    - category (str, optional): Only display the records under this category.
+
+    Returns:
+    - int: The exit status, 1 if the ledger cannot be streamed.
+    """
+    if not os.path.exists(filename):
+        sys.stderr.write(f"{filename} does not exist.\n")
+        return 1
+    binary = Snapshot.is_snapshot(filename)
+    if SQLiteStorage.is_database(filename) or (binary and category is not None):
+        sys.stderr.write(f"{filename} cannot be streamed, only a text ledger or the view of a binary snapshot can.\n")
+        return 1
+    if category is not None and not categories_manager.is_category_valid(category):
+        sys.stderr.write(f"The specified category is not in the category list.\n")
+        return 1
+    journal = filename + '.journal'
+    try:
+        with open(journal, 'rb') as file:
+            # The first line is the header, every other line is a change
+            pending = sum(1 for _ in file) > 1
+    except FileNotFoundError:
+        pending = False
+    if pending:
+        sys.stderr.write(f"The changes in {journal} are not saved to {filename} yet and are not shown.\n")
+    if binary:
+        snapshot_view(filename)
+    elif category is None:
+        stream_view(filename)
+    else:
+        stream_find(categories_manager, category, filename)
+    return 0
+
+
+async def serve(records_manager, host='127.0.0.1', port=8765, checkpoint_interval=5.0):
+    """
+    Serve the ledger to local clients until cancelled, keeping it loaded in memory.
+
+    Clients send the command lines of '--script' mode over TCP and get one JSON line back
+    per command, in order. Commands may be pipelined: every chunk of lines that has
+    arrived is run as one 'run_batch', so a burst of adds becomes one journal write.
+    Each batch runs without yielding to the event loop, so clients never see a half-applied
+    batch while many of them read at once. The journal is folded into the ledger file in
+    the background once it has grown large enough.
+
+    Parameters:
+    - records_manager (Records): The ledger to serve.
+    - host (str, optional): The loopback address to listen on, 127.0.0.1 unless given.
+    - port (int, optional): The port to listen on.
+    - checkpoint_interval (float, optional): Seconds between checks of the journal size.
+
+    Raises:
+    - ValueError: If the host is not a loopback address.
+    """
+    async def handle(reader, writer):
+        pending = b''
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                pending += chunk
+                if b'\n' not in pending:
+                    continue
+                complete, _, pending = pending.rpartition(b'\n')
+                # Changes made by other processes on the same ledger become visible first
+                records_manager.refresh()
+                results = run_batch(records_manager, complete.decode().split('\n'))
+                writer.write(''.join(map(format_json, results)).encode())
+                await writer.drain()
+        except (ConnectionError, UnicodeDecodeError) as e:
+            sys.stderr.write(f"Closing connection: {e}\n")
+        finally:
+            writer.close()
+
+    # Clients are not authenticated, so the service never listens beyond this machine
+    if host != 'localhost' and not ipaddress.ip_address(host).is_loopback:
+        raise ValueError(f"refusing to serve on {host}, only loopback addresses are allowed")
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Serving {records_manager._filename} on {host}:{port}")
+    async with server:
+        while True:
+            await asyncio.sleep(checkpoint_interval)
+            records_manager.checkpoint()
+
+
+def open_ledger(categories_manager, args, initial_money=None):
+    """
+    Open the ledger named on the command line, or exit with status 1 if it cannot be opened safely.
+
+    Parameters:
+    - categories_manager (Categories): Instance of the Categories class.
+    - args (argparse.Namespace): The parsed command line.
+    - initial_money (int, optional): The balance of a new ledger; prompted for if None.
+
+    Returns:
+    - Records: The opened ledger.
+    """
+    try:
+        return Records(categories_manager, args.ledger, initial_money, args.workers, args.debug,
+                       cache_size=args.cache_size)
+    except RuntimeError as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
+
+
 def main():
     """
     The main function for managing expense and income records.
@@ -354,36 +4182,186 @@ def main():
     It starts the Categories and Records managers, then enters a loop
     To process user commands interactively. User can add records, view records, .
     Delete records, view the category, search for a record based on the category, or exit the program.
+    The ledger file is 'records.txt' unless another file, text, binary snapshot or SQLite database
+    ('.db', '.sqlite' or '.sqlite3'), is given as the first argument.
+    With '--script FILE' (or '--script -' for stdin) the commands are read from the file instead,
+    run without prompts, and their results are written to stdout as JSON lines or TSV ('--format').
+    The exit status is then 1 if a command failed, rejected a row or did not find a record to delete.
+    With '--serve PORT' the ledger stays loaded and the same commands are served to local clients.
+    With '--stream-view' or '--stream-find CATEGORY' a text ledger is displayed as it is read, without loading it;
+    '--stream-view' also displays a binary snapshot in place.
 
     Commands:
     - 'add': Add new records to the system.
+    - 'import': Add the records of a CSV file in batches.
     - 'view': Display all existing records and the current balance.
     - 'delete': Remove a specific record by its description.
     - 'view_categories': Display the hierarchical structure of available categories.
+    - 'edit_categories': Add, rename or move a category; the tree is saved next to the ledger.
     - 'find': Find and display records based on specified categories.
+    - 'report': Display the balance and the total of every category subtree.
+    - 'period': Display the records and monthly totals of a category between two dates.
+    - 'metrics': Turn the operation metrics on or off, or display them as JSON or Prometheus text.
+    - 'profile': Start profiling with cProfile and tracemalloc, or stop and display the report.
     - 'exit': Save the current records and exit the program.
 
     Returns:
     None
     """
-    categories_manager = Categories()
-    records_manager = Records(categories_manager) 
+    parser = argparse.ArgumentParser(description="Manage expense and income records.")
+    parser.add_argument('ledger', nargs='?', default='records.txt',
+                        help="the ledger file: text, binary snapshot or SQLite database (default: records.txt)")
+    parser.add_argument('--script',
+                        help="run the commands of this file ('-' for stdin) without prompts; "
+                             "exit with status 1 if a command failed or skipped a row")
+    parser.add_argument('--format', choices=['json', 'tsv'], default='json', help="output format of --script")
+    parser.add_argument('--initial', type=parse_amount, default=0,
+                        help="balance of a new ledger in --script or --serve mode")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes that parse a text ledger, 0 for one per CPU (default: 1)")
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help="serve the --script commands to clients on this localhost port")
+    parser.add_argument('--stream-view', action='store_true',
+                        help="display the records of a text ledger or binary snapshot without loading it, and exit")
+    parser.add_argument('--stream-find', metavar='CATEGORY',
+                        help="display the records of a text ledger under CATEGORY as it is read, and exit")
+    parser.add_argument('--limit', type=int, help="list at most this many records in view and find")
+    parser.add_argument('--offset', type=int, default=0, help="skip this many records in view and find")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--top', type=int, metavar='N', help="list only the N records with the largest amounts")
+    group.add_argument('--bottom', type=int, metavar='N', help="list only the N records with the smallest amounts")
+    parser.add_argument('--view-format', choices=['table', 'csv', 'json'], default='table',
+                        help="output of the interactive view and find (default: table)")
+    parser.add_argument('--page-size', type=int, default=0,
+                        help="records per page of the interactive view and find, 0 for no pages (default: 0)")
+    parser.add_argument('--cache-size', type=int, default=128,
+                        help="find and view results kept in the result cache, 0 to turn it off (default: 128)")
+    parser.add_argument('--metrics', action='store_true', help="record operation metrics from the start")
+    parser.add_argument('--debug', action='store_true',
+                        help="check the running balance and totals against a full recompute after every change")
+    args = parser.parse_args()
+
+    # Turned on before loading, so the load is measured too
+    METRICS.enabled = args.metrics
+    selection = {'offset': args.offset, 'limit': args.limit, 'top': args.top, 'bottom': args.bottom}
+    if selection == {'offset': 0, 'limit': None, 'top': None, 'bottom': None}:
+        selection = None
+    categories_manager = Categories(os.path.splitext(args.ledger)[0] + '.categories')
+    if args.stream_view or args.stream_find is not None:
+        sys.exit(stream_ledger(categories_manager, args.ledger, args.stream_find))
+    if args.script is not None:
+        # Messages go to stderr, so stdout only carries the results
+        with contextlib.redirect_stdout(sys.stderr):
+            records_manager = open_ledger(categories_manager, args, args.initial)
+        if args.script == '-':
+            failures = run_script(records_manager, sys.stdin, args.format, options=selection)
+        else:
+            with open(args.script, 'r') as file:
+                failures = run_script(records_manager, file, args.format, options=selection)
+        with contextlib.redirect_stdout(sys.stderr):
+            records_manager.save()
+        sys.exit(1 if failures else 0)
+    if args.serve is not None:
+        # Stdout is not used by the service, its messages go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            records_manager = open_ledger(categories_manager, args, args.initial)
+            try:
+                asyncio.run(serve(records_manager, port=args.serve))
+            except KeyboardInterrupt:
+                pass
+            finally:
+                records_manager.save()
+        return
+
+    records_manager = open_ledger(categories_manager, args)
+    display = dict(selection or {}, output_format=args.view_format,
+                   page_size=args.page_size if sys.stdout.isatty() else 0)
 
     while True:
-        command = input("What do you want to do (add / view / delete / find / view_categories / exit)?")
+        command = input("What do you want to do (add / import / view / delete / find / search / report / period / view_categories / edit_categories / metrics / profile / exit)?")
+        if command in ("view", "find", "search", "report", "period"):
+            # Show what other sessions on the same ledger have changed too
+            records_manager.refresh()
         if command == "add":
-            records_input = input("Enter the record(s) (category description amount): ")
+            records_input = input("Enter the record(s) (category description amount [YYYY-MM-DD]): ")
             records_manager.add(records_input)
         elif command == "view":
-            records_manager.view()
+            try:
+                records_manager.view(**display)
+            except OverflowError as e:
+                sys.stderr.write(f"An error occurred when adding up the records: {e}\n")
         elif command == "delete":
             delete_desc = input("Which record do you want to delete?: ")
-            records_manager.delete(delete_desc)
+            if ',' in delete_desc:
+                # Several descriptions at once go through the bulk path
+                not_found = records_manager.delete_many(' '.join(desc.split()) for desc in delete_desc.split(','))
+                for desc in not_found:
+                    print(f"Record '{desc}' not found.")
+            else:
+                records_manager.delete(' '.join(delete_desc.split()))
+        elif command == "import":
+            filename = input("Enter the CSV file to import (category,description,amount): ")
+            try:
+                with open(filename, 'r', newline='') as file:
+                    report = records_manager.ingest_csv(file)
+                print(report.summary())
+                for number, row, reason in report.errors[:10]:
+                    sys.stderr.write(f"Row {number}: {reason}: {row}\n")
+            except OSError as e:
+                sys.stderr.write(f"An error occurred when trying to import records: {e}\n")
+        elif command == "report":
+            try:
+                records_manager.report()
+            except OverflowError as e:
+                sys.stderr.write(f"An error occurred when adding up the records: {e}\n")
+        elif command == "period":
+            period_input = input("Enter the category and the first and last dates (category YYYY-MM-DD YYYY-MM-DD): ")
+            try:
+                category, first, last = period_input.split()
+                records_manager.period(category, parse_timestamp(first) // 86400, parse_timestamp(last) // 86400)
+            except ValueError:
+                sys.stderr.write("Invalid input. Please use 'category YYYY-MM-DD YYYY-MM-DD' format.\n")
+            except OverflowError as e:
+                sys.stderr.write(f"An error occurred when adding up the records: {e}\n")
         elif command == "view_categories":
             categories_manager.view()
+        elif command == "edit_categories":
+            edit = input("Enter the edit (add name [parent] / rename old new / move name [parent]): ")
+            try:
+                edit_category(records_manager, edit)
+                categories_manager.view()
+            except ValueError as e:
+                sys.stderr.write(f"Invalid edit: {e}\n")
+        elif command == "metrics":
+            choice = input("Enter on, off, json or prometheus: ").strip()
+            if choice in ('on', 'off'):
+                METRICS.enabled = choice == 'on'
+                print(f"Metrics {'enabled' if METRICS.enabled else 'disabled'}.")
+            elif choice == 'json':
+                print(json.dumps(METRICS.to_dict(), indent=2))
+            elif choice == 'prometheus':
+                print(METRICS.to_prometheus(), end='')
+            else:
+                sys.stderr.write("Invalid input. Please enter on, off, json or prometheus.\n")
+        elif command == "profile":
+            if METRICS.profiling:
+                print(METRICS.stop_profile())
+            else:
+                METRICS.start_profile()
+                print("Profiling started, enter 'profile' again to stop and see the report.")
         elif command == "find":
             categories_to_find = input("Enter the categories to find: ")
-            records_manager.find(categories_to_find)
+            try:
+                records_manager.find(categories_to_find, **display)
+            except OverflowError as e:
+                sys.stderr.write(f"An error occurred when adding up the records: {e}\n")
+        elif command == "search":
+            query = input("Enter the words to search for (end a word with * to match its prefix): ")
+            category = input("Enter the category to search in (empty for all): ").strip()
+            try:
+                records_manager.search(query, category or None, **display)
+            except OverflowError as e:
+                sys.stderr.write(f"An error occurred when adding up the records: {e}\n")
         elif command == "exit":
             records_manager.save()
             break
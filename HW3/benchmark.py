@@ -0,0 +1,309 @@
+"""
+Benchmark the Pymoney hot paths on synthetic ledgers.
+
+Every operation of the HW3 'Records' and 'Categories' classes is timed on generated
+ledgers of growing size, next to the HW2 string-list implementation as a baseline.
+Results are written as JSON so runs on different commits can be compared.
+
+Usage:
+    python benchmark.py --sizes 10000 100000 1000000 --depth 3 --breadth 4 --output results.json
+"""
+import argparse
+import builtins
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name, path):
+    """
+    Import a homework script by path, its file name is not a valid module name.
+
+    Parameters:
+    - name (str): The name to give the module.
+    - path (str): Path to the script.
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+hw3 = load_module('pymoney_hw3', os.path.join(HERE, '109006271_Tuguldur_hw3.py'))
+hw2 = load_module('pymoney_hw2', os.path.join(HERE, '..', 'HW2', '109006271_Tuguldur_hw2.py'))
+
+
+def make_tree(depth, breadth, prefix='c'):
+    """
+    Build a nested category list in the format of 'Categories._categories'.
+
+    Parameters:
+    - depth (int): Number of levels below the top level.
+    - breadth (int): Number of children of every category.
+    - prefix (str, optional): Prefix of the generated names.
+
+    Returns:
+    - list: The nested list of categories.
+    """
+    tree = []
+    for i in range(breadth):
+        # Category names must be alphabetic, so indexes are spelled with letters
+        name = prefix + chr(ord('a') + i)
+        tree.append(name)
+        if depth > 0:
+            tree.append(make_tree(depth - 1, breadth, name))
+    return tree
+
+
+def make_categories(depth, breadth):
+    """Return a 'Categories' instance holding a generated tree."""
+    categories = hw3.Categories()
+    categories._categories = make_tree(depth, breadth)
+    categories._reindex()
+    return categories
+
+
+def make_rows(count, names, seed=0):
+    """
+    Generate random (category, description, amount) rows.
+
+    Parameters:
+    - count (int): Number of rows.
+    - names (list): The category names to pick from.
+    - seed (int, optional): Seed of the random generator.
+    """
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(6)) for _ in range(1000)]
+    for _ in range(count):
+        yield rng.choice(names), rng.choice(words), rng.randint(-500, 500)
+
+
+def write_ledgers(directory, rows):
+    """
+    Write the same rows as an HW3 'records.txt' and an HW2 'records.txt'.
+
+    Returns:
+    - tuple: The HW3 file path and the HW2 file path.
+    """
+    hw3_path = os.path.join(directory, 'hw3', 'records.txt')
+    hw2_path = os.path.join(directory, 'hw2', 'records.txt')
+    os.makedirs(os.path.dirname(hw3_path))
+    os.makedirs(os.path.dirname(hw2_path))
+    with open(hw3_path, 'w') as hw3_file, open(hw2_path, 'w') as hw2_file:
+        for category, description, amount in rows:
+            hw3_file.write(f"{category} {description} {amount}\n")
+            hw2_file.write(f"{description} {amount}\n")
+        hw3_file.write("Balance: 1000\n")
+        hw2_file.write("Balance: 1000\n")
+    return hw3_path, hw2_path
+
+
+@contextlib.contextmanager
+def quiet(answers=()):
+    """
+    Silence stdout/stderr and answer input() prompts from a list.
+
+    Parameters:
+    - answers (iterable, optional): The answers returned by input(), in order.
+    """
+    answers = iter(answers)
+    real_input = builtins.input
+    builtins.input = lambda prompt='': next(answers)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            yield
+    finally:
+        builtins.input = real_input
+
+
+def measure(name, size, function, repeat=1):
+    """
+    Time a function and track the peak memory it allocates.
+
+    Parameters:
+    - name (str): Name of the operation.
+    - size (int): Number of records in the ledger.
+    - function (callable): The operation, called without arguments.
+    - repeat (int, optional): Number of calls; the best time is kept.
+
+    Returns:
+    - dict: The result row.
+    """
+    best = None
+    peak = 0
+    for _ in range(repeat):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if tracing:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        best = elapsed if best is None else min(best, elapsed)
+    result = {'operation': name, 'records': size, 'seconds': best}
+    if tracemalloc.is_tracing():
+        result['peak_bytes'] = peak
+    # Progress goes to the real stderr, the operation itself may run silenced
+    print(f"{name:<32} {size:>10} {best:>10.4f}s", file=sys.__stderr__)
+    return result
+
+
+def bench_hw3(size, categories, path, operations, repeat):
+    """
+    Benchmark the HW3 'Records' and 'Categories' operations on one ledger.
+
+    Returns:
+    - list: The result rows.
+    """
+    results = []
+    names = list(categories._order)
+    records_box = []
+
+    def load():
+        with quiet():
+            # Without the result cache, so the repeated finds and views time the real work
+            records_box[:] = [hw3.Records(categories, path, cache_size=0)]
+    results.append(measure('hw3.load', size, load))
+    records = records_box[0]
+
+    if 'is_category_valid' in operations:
+        lookups = names * max(1, 100000 // len(names))
+        results.append(measure('hw3.is_category_valid', size,
+                               lambda: [categories.is_category_valid(name) for name in lookups], repeat))
+    if 'find_categories' in operations:
+        results.append(measure('hw3.find_categories', size,
+                               lambda: [categories.find_categories(name) for name in names], repeat))
+    if 'add' in operations:
+        line = ', '.join(f"{category} {description} {amount}"
+                         for category, description, amount in make_rows(1000, names, seed=1))
+        with quiet():
+            results.append(measure('hw3.add(1000)', size, lambda: records.add(line), repeat))
+    if 'ingest' in operations:
+        rows = list(make_rows(10000, names, seed=2))
+        with quiet():
+            results.append(measure('hw3.ingest(10000)', size, lambda: records.ingest(rows), repeat))
+    if 'find' in operations:
+        with quiet():
+            results.append(measure('hw3.find(top)', size, lambda: records.find(names[0]), repeat))
+    if 'view' in operations:
+        with quiet():
+            results.append(measure('hw3.view', size, records.view, repeat))
+    if 'delete' in operations:
+        descriptions = [description for _, description, _ in make_rows(1000, names, seed=1)]
+        with quiet():
+            results.append(measure('hw3.delete_many(1000)', size, lambda: records.delete_many(descriptions)))
+    if 'save' in operations:
+        with quiet():
+            results.append(measure('hw3.compact', size, records.compact))
+    return results
+
+
+def bench_hw2(size, path, operations, repeat):
+    """
+    Benchmark the HW2 string-list functions on one ledger as a baseline.
+
+    Returns:
+    - list: The result rows.
+    """
+    results = []
+    state = {}
+    cwd = os.getcwd()
+    # HW2 always works on 'records.txt' in the current directory
+    os.chdir(os.path.dirname(path))
+    try:
+        def load():
+            with quiet():
+                state['records'], state['balance'] = hw2.initialize()
+        results.append(measure('hw2.load', size, load))
+        if 'add' in operations:
+            line = ', '.join(f"{description} {amount}" for _, description, amount in make_rows(1000, ['x'], seed=1))
+            with quiet([line] * repeat):
+                results.append(measure('hw2.add(1000)', size, lambda: hw2.add_records(state['records']), repeat))
+        if 'view' in operations:
+            with quiet():
+                results.append(measure('hw2.view', size,
+                                       lambda: hw2.view_records(state['records'], state['balance']), repeat))
+        if 'delete' in operations:
+            descriptions = [description for _, description, _ in make_rows(1000, ['x'], seed=1)]
+            def delete():
+                for _ in descriptions:
+                    hw2.delete_record(state['records'], state['balance'])
+            with quiet(descriptions):
+                results.append(measure('hw2.delete(1000)', size, delete))
+        if 'save' in operations:
+            with quiet():
+                results.append(measure('hw2.save', size, lambda: hw2.save_records(state['records'], state['balance'])))
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """
+    Parse the command line, run the benchmarks and write the results.
+    """
+    all_operations = ['is_category_valid', 'find_categories', 'add', 'ingest', 'find', 'view', 'delete', 'save']
+    parser = argparse.ArgumentParser(description="Benchmark the Pymoney hot paths.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help="ledger sizes to generate (default: 10000 100000)")
+    parser.add_argument('--depth', type=int, default=2, help="levels below the top of the category tree")
+    parser.add_argument('--breadth', type=int, default=3, help="children of every category")
+    parser.add_argument('--operations', nargs='+', choices=all_operations, default=all_operations)
+    parser.add_argument('--repeat', type=int, default=3, help="calls per read-only operation, best kept")
+    parser.add_argument('--memory', action='store_true',
+                        help="track peak memory with tracemalloc (makes the timings slower)")
+    parser.add_argument('--no-baseline', action='store_true', help="skip the HW2 baseline")
+    parser.add_argument('--output', default='bench_results.json', help="JSON file to write")
+    args = parser.parse_args()
+
+    categories = make_categories(args.depth, args.breadth)
+    results = []
+    if args.memory:
+        tracemalloc.start()
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            hw3_path, hw2_path = write_ledgers(directory, make_rows(size, list(categories._order)))
+            results += bench_hw3(size, categories, hw3_path, args.operations, args.repeat)
+            if not args.no_baseline:
+                results += bench_hw2(size, hw2_path, args.operations, args.repeat)
+    if args.memory:
+        tracemalloc.stop()
+
+    output = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'depth': args.depth,
+        'breadth': args.breadth,
+        'memory_traced': args.memory,
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(output, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1009 @@
+"""
+Tests of the HW3 ledger, one test case per feature: storage formats, journal and sessions, loading, queries and modes.
+
+Run from any directory with 'python test_hw3.py'.
+"""
+import asyncio
+import contextlib
+import csv
+import decimal
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from array import array
+from datetime import date
+from unittest import mock
+
+# Imported under its own module name, so the load workers can find '_parse_range'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+hw3 = importlib.import_module('109006271_Tuguldur_hw3')
+SCRIPT = hw3.__file__
+
+WORDS = ['apple', 'apricot', 'bread', 'bus', 'busy', 'coffee', 'cola', 'rice', 'rent', 'tea']
+
+
+def quiet():
+    """Return a context manager that drops what the code under test prints."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def open_records(filename, workers=1):
+    """
+    Open a ledger with the default category tree, without the result cache.
+
+    Parameters:
+    - filename (str): The ledger file.
+    - workers (int, optional): Number of processes that parse a text ledger.
+
+    Returns:
+    - Records: The opened ledger, with a balance of 100.00 if it is new.
+    """
+    with quiet():
+        return hw3.Records(hw3.Categories(), filename, 10000, workers, debug=True, cache_size=0)
+
+
+def random_rows(rng, count):
+    """
+    Generate random (category, description, amount, timestamp) rows of the default categories.
+
+    Parameters:
+    - rng (random.Random): The random generator.
+    - count (int): Number of rows.
+
+    Returns:
+    - list: The rows, about a quarter of them without a date.
+    """
+    categories = list(hw3.Categories()._order)
+    rows = []
+    for _ in range(count):
+        description = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+        timestamp = hw3.NO_DATE if rng.random() < 0.25 else rng.randrange(1262304000, 1735689600, 86400)
+        rows.append((rng.choice(categories), description, rng.randint(-50000, 50000), timestamp))
+    return rows
+
+
+def ledger_line(category, description, amount, timestamp):
+    """Return a row as a line of a text ledger."""
+    date = f' {hw3.format_timestamp(timestamp)}' if timestamp != hw3.NO_DATE else ''
+    return f'{category} {description} {hw3.format_amount(amount)}{date}\n'
+
+
+def index_state(records):
+    """
+    Return the indexes of a Records instance as plain values that compare equal when the indexes are the same.
+    """
+    store = records._store
+    return {
+        'rows': list(store.rows()),
+        'balance': records._balance,
+        'totals': records._totals,
+        'counts': records._counts,
+        'positions': {name: list(bucket) for name, bucket in records._positions.items()},
+        'descriptions': {name: list(stack) for name, stack in records._descriptions.items()},
+        'times': list(records._times),
+        'time_positions': list(records._time_positions),
+        'daily': records._daily,
+        'monthly': records._monthly,
+    }
+
+
+class TwoSessionTest(unittest.TestCase):
+    """Two sessions on the same ledger see each other's changes through the journal."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'records.txt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_and_merge(self):
+        first = open_records(self.filename)
+        second = open_records(self.filename)
+        with quiet():
+            first.add('food lunch -50, salary pay 1000 2024-03-01')
+            second.add('meal dinner -20.25')
+            first.refresh()
+            second.refresh()
+        self.assertEqual(list(first._iter_records()), list(second._iter_records()))
+        self.assertEqual(first.balance(), 10000 - 5000 + 100000 - 2025)
+
+        # A rewrite of the ledger by one session is picked up by the other
+        with quiet():
+            first.compact()
+            second.delete_many(['lunch'])
+            first.refresh()
+        self.assertEqual(list(first._iter_records()), list(second._iter_records()))
+        self.assertNotIn('lunch', [row[1] for row in first._iter_records()])
+
+        with quiet():
+            first.save()
+            second.save()
+        reopened = open_records(self.filename)
+        self.assertEqual([row[1] for row in reopened._iter_records()], ['pay', 'dinner'])
+        self.assertEqual(reopened.balance(), 10000 + 100000 - 2025)
+        self.assertTrue(reopened.verify())
+        with quiet():
+            reopened.save()
+
+
+def run_script(filename, commands, *options):
+    """
+    Run commands through '--script -' in a new process.
+
+    Parameters:
+    - filename (str): The ledger file.
+    - commands (str): The command lines.
+    - options (str): More command line options.
+
+    Returns:
+    - subprocess.CompletedProcess: The finished process, with its output as text.
+    """
+    return subprocess.run([sys.executable, SCRIPT, filename, '--script', '-', '--initial', '100', *options],
+                          input=commands, capture_output=True, text=True, timeout=60)
+
+
+class JournalTest(unittest.TestCase):
+    """Changes kept in the journal survive anything that does not change the records of the ledger file."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'records.txt')
+        with open(self.filename, 'w') as file:
+            file.write('food bread -2\nBalance: 100\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_and_close(self, filename, line):
+        """Add records to a ledger and close it with the records still only in the journal."""
+        records = open_records(filename)
+        with quiet():
+            records.add(line)
+            records.save()
+        self.assertTrue(os.path.getsize(filename + '.journal') > 0)
+
+    def descriptions(self, filename):
+        """Open a ledger and return the descriptions of its records."""
+        records = open_records(filename)
+        with quiet():
+            records.save()
+        return [row[1] for row in records._iter_records()]
+
+    def test_touch(self):
+        self.add_and_close(self.filename, 'food lunch -50')
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 10))
+        self.assertEqual(self.descriptions(self.filename), ['bread', 'lunch'])
+
+    def test_copy(self):
+        self.add_and_close(self.filename, 'food lunch -50')
+        copy = os.path.join(self.directory.name, 'copy')
+        os.mkdir(copy)
+        for name in os.listdir(self.directory.name):
+            if name.startswith('records.txt'):
+                # Without the modification times, like 'cp -r'
+                shutil.copy(os.path.join(self.directory.name, name), copy)
+        journal_size = os.path.getsize(self.filename + '.journal')
+        self.assertEqual(self.descriptions(os.path.join(copy, 'records.txt')), ['bread', 'lunch'])
+        self.assertEqual(os.path.getsize(self.filename + '.journal'), journal_size)
+
+    def test_other_ledger_sets_the_journal_aside(self):
+        self.add_and_close(self.filename, 'food lunch -50')
+        with open(self.filename + '.journal') as file:
+            journal = file.read()
+        with open(self.filename, 'w') as file:
+            file.write('food rice -3\nBalance: 100\n')
+        with self.assertRaises(RuntimeError):
+            open_records(self.filename)
+        with open(self.filename + '.journal.stale') as file:
+            self.assertEqual(file.read(), journal)
+        self.assertEqual(self.descriptions(self.filename), ['rice'])
+
+    def test_journal_per_ledger(self):
+        self.add_and_close(self.filename, 'food lunch -50')
+        other = os.path.join(self.directory.name, 'records.bin')
+        with open(other, 'wb') as file:
+            hw3.Snapshot.write(file, hw3.RecordStore(), 100)
+        self.add_and_close(other, 'food dinner -20')
+        self.assertEqual(self.descriptions(other), ['dinner'])
+        self.assertEqual(self.descriptions(self.filename), ['bread', 'lunch'])
+
+
+class IngestTest(unittest.TestCase):
+    """Batch ingestion reads amounts in one unit, and reports rejected rows instead of printing them."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.directory.name, 'records.txt')
+        with open(filename, 'w') as file:
+            file.write('Balance: 100\n')
+        self.records = open_records(filename)
+
+    def tearDown(self):
+        with quiet():
+            self.records.save()
+        self.directory.cleanup()
+
+    def test_amount_units(self):
+        report = self.records.ingest([('food', 'a', 10), ('food', 'b', '10'), ('food', 'c', decimal.Decimal('10')),
+                                      ('food', 'd', '-0.25')])
+        self.assertEqual(report.added, 4)
+        report = self.records.ingest_csv(io.StringIO('category,description,amount\nfood,e,10\n'))
+        self.assertEqual(report.added, 1)
+        self.assertEqual([row[2] for row in self.records._iter_records()], [1000, 1000, 1000, -25, 1000])
+
+    def test_report(self):
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            report = self.records.ingest([('food', 'a', '1'), ('nowhere', 'b', '2'), ('food', 'c', 'x'),
+                                          ('food', 'd', '1', 'not a date'), ('food', 'e', '1.234')],
+                                         chunk_size=2)
+        self.assertEqual(report.added, 1)
+        self.assertEqual([(number, reason) for number, _, reason in report.errors],
+                         [(2, 'invalid category'), (3, 'invalid format'), (4, 'invalid date'), (5, 'invalid format')])
+        self.assertEqual(errors.getvalue(), '')
+
+
+class ScriptModeTest(unittest.TestCase):
+    """The --script mode writes one result per command and reports partial failures in its exit status."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'records.txt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_json_results(self):
+        done = run_script(self.filename, 'add food lunch -50, salary pay 1000\n# a comment\n\nfind food\nbalance\n')
+        self.assertEqual(done.returncode, 0, done.stderr)
+        results = [json.loads(line) for line in done.stdout.splitlines()]
+        self.assertEqual([result['command'] for result in results], ['add', 'find', 'balance'])
+        self.assertEqual(results[0]['added'], 2)
+        self.assertEqual([row[1] for row in results[1]['records']], ['lunch'])
+        # One load and one save per run: the next run sees the changes
+        done = run_script(self.filename, 'view\n', '--format', 'tsv')
+        self.assertEqual(done.returncode, 0, done.stderr)
+        self.assertIn('lunch', done.stdout)
+        self.assertIn('pay', done.stdout)
+
+    def test_exit_status(self):
+        self.assertEqual(run_script(self.filename, 'nonsense\n').returncode, 1)
+        done = run_script(self.filename, 'add food lunch -50, food 12 oops, nowhere x 1\n')
+        self.assertEqual(done.returncode, 1)
+        result = json.loads(done.stdout)
+        self.assertEqual(result['added'], 1)
+        self.assertEqual([error['row'] for error in result['errors']], [2, 3])
+        self.assertEqual(run_script(self.filename, 'delete lunch, supper\n').returncode, 1)
+        self.assertEqual(run_script(self.filename, 'add food lunch -50\ndelete lunch\n').returncode, 0)
+
+
+class CategoryTreeTest(unittest.TestCase):
+    """Edits of the category tree are saved next to the ledger, and a rename reaches the records."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'records.txt')
+        self.tree = os.path.join(self.directory.name, 'records.categories')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_edits_are_persisted(self):
+        categories = hw3.Categories(self.tree)
+        categories.add('coffee', 'drink')
+        categories.move('snack', 'income')
+        categories.rename('bus', 'coach')
+        reopened = hw3.Categories(self.tree)
+        self.assertEqual(reopened._order, categories._order)
+        self.assertTrue(reopened.is_under('coffee', 'expense'))
+        self.assertTrue(reopened.is_under('snack', 'income'))
+        self.assertFalse(reopened.is_under('snack', 'food'))
+        self.assertEqual(reopened.subtree('transport'), {'transport', 'coach', 'railway'})
+        with self.assertRaises(ValueError):
+            reopened.move('expense', 'meal')
+        with self.assertRaises(ValueError):
+            reopened.add('food')
+
+    def test_rename_reaches_the_records(self):
+        with quiet():
+            records = hw3.Records(hw3.Categories(self.tree), self.filename, 10000)
+            records.add('meal lunch -50, food bread -20')
+            hw3.edit_category(records, 'rename meal dinner')
+            self.assertEqual([row[0] for row in records.find_records('food')[0]], ['dinner', 'food'])
+            records.save()
+            reopened = hw3.Records(hw3.Categories(self.tree), self.filename)
+        self.assertEqual([row[0] for row in reopened._iter_records()], ['dinner', 'food'])
+        self.assertEqual(reopened.find_records('dinner')[1], -5000)
+        with quiet():
+            reopened.save()
+
+
+class ParallelLoadTest(unittest.TestCase):
+    """A text ledger loaded by worker processes matches the same ledger loaded serially."""
+
+    def test_parallel_matches_serial(self):
+        rng = random.Random(1)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'records.txt')
+            with open(filename, 'w') as file:
+                file.write('Balance: 12.34\n')
+                for number, row in enumerate(random_rows(rng, 600)):
+                    file.write(ledger_line(*row))
+                    if number % 97 == 0:
+                        file.write('not a record\n')
+            size = os.path.getsize(filename)
+
+            def small_ranges(filename, workers):
+                # Many ranges that end in the middle of lines
+                return [(start, min(start + 1000, size)) for start in range(0, size, 1000)]
+
+            with contextlib.redirect_stderr(io.StringIO()) as serial_errors:
+                serial = open_records(filename)
+            with mock.patch.object(hw3, '_byte_ranges', small_ranges), \
+                    contextlib.redirect_stderr(io.StringIO()) as parallel_errors:
+                parallel = open_records(filename, workers=2)
+            self.assertEqual(index_state(parallel), index_state(serial))
+            self.assertEqual(parallel._initial_money, 1234)
+            self.assertEqual(parallel_errors.getvalue(), serial_errors.getvalue())
+            with quiet():
+                serial.save()
+                parallel.save()
+
+
+class QueryTest(unittest.TestCase):
+    """Search and period queries match a scan of every record."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rng = random.Random(2)
+        self.records = open_records(os.path.join(self.directory.name, 'records.txt'))
+        rows = random_rows(self.rng, 800)
+        # 'ingest' reads int amounts as whole units, the rows are in cents
+        self.records.ingest([(category, description, hw3.format_amount(amount), timestamp)
+                             for category, description, amount, timestamp in rows])
+        # Deleted records must leave every index
+        with quiet():
+            self.records.delete_many([row[1] for row in self.rng.sample(rows, 100)])
+        self.categories = self.records._categories_manager
+
+    def tearDown(self):
+        with quiet():
+            self.records.save()
+        self.directory.cleanup()
+
+    def test_search(self):
+        for _ in range(200):
+            terms = [self.rng.choice(WORDS) for _ in range(self.rng.randint(1, 2))]
+            terms = [term[:self.rng.randint(1, len(term))] + '*' if self.rng.random() < 0.5 else term
+                     for term in terms]
+            category = self.rng.choice([None, 'expense', 'food', 'income'])
+            query = ' '.join(terms)
+            found, total = self.records.search_records(hw3.parse_search(query), category)
+
+            subtree = None if category is None else self.categories.subtree(category)
+            expected = []
+            for row in self.records._iter_records():
+                words = hw3.description_words(row[1])
+                if subtree is not None and row[0] not in subtree:
+                    continue
+                if all(any(word.startswith(term[:-1]) for word in words) if term.endswith('*') else term in words
+                       for term in terms):
+                    expected.append(row)
+            self.assertEqual(sorted(found), sorted(expected), query)
+            self.assertEqual(total, sum(row[2] for row in expected), query)
+
+    def test_period(self):
+        for _ in range(200):
+            category = self.rng.choice(['expense', 'food', 'meal', 'income', 'bonus'])
+            first_day = self.rng.randrange(14610, 20089)
+            last_day = first_day + self.rng.randrange(0, 800)
+            subtree = self.categories.subtree(category)
+            dated = [row for row in self.records._iter_records()
+                     if row[0] in subtree and row[3] != hw3.NO_DATE and first_day <= row[3] // 86400 <= last_day]
+
+            months = {}
+            for row in dated:
+                month = hw3.month_key(row[3] // 86400)
+                months[month] = months.get(month, 0) + row[2]
+            totals = dict(self.records.period_totals(category, first_day, last_day))
+            self.assertEqual({month: total for month, total in totals.items() if total},
+                             {month: total for month, total in months.items() if total})
+
+            found = self.records.records_between(category, first_day * 86400, (last_day + 1) * 86400)
+            self.assertEqual(found, sorted(dated, key=lambda row: row[3]))
+
+    def test_last_month(self):
+        # The walk over the months of a period ends at date.max
+        last_day = date.max.toordinal() - date(1970, 1, 1).toordinal()
+        months = self.records.period_totals('food', last_day - 90, last_day)
+        self.assertEqual(months[-1], (date.max.year * 12 + 11, 0))
+
+
+class EpochDateTest(unittest.TestCase):
+    """A record dated 1970-01-01 keeps its date: only NO_DATE means a record has none."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_dates(self, records):
+        self.assertEqual(records.records_between('food', 0, 86400), [('food', 'old', -500, 0)])
+        self.assertEqual(records.period_totals('food', 0, 0), [(hw3.month_key(0), -500)])
+        self.assertEqual(records.records_between('food'), [('food', 'old', -500, 0)])
+
+    def test_text_ledger(self):
+        filename = os.path.join(self.directory.name, 'records.txt')
+        with open(filename, 'w') as file:
+            file.write('food none -3\nfood old -5 1970-01-01\nBalance: 100\n')
+        records = open_records(filename)
+        self.check_dates(records)
+        with quiet():
+            records.add('food new -1 1970-01-01')
+            records.save()
+        # Read back from the journal, then from the rewritten ledger
+        records = open_records(filename)
+        self.assertEqual(records.records_between('food', 0, 86400),
+                         [('food', 'old', -500, 0), ('food', 'new', -100, 0)])
+        with quiet():
+            records.compact()
+            records.save()
+        with open(filename) as file:
+            self.assertEqual(file.read(),
+                             'food none -3.00\nfood old -5.00 1970-01-01\nfood new -1.00 1970-01-01\nBalance: 100.00\n')
+        records = open_records(filename)
+        self.assertEqual(records._store.timestamps[0], hw3.NO_DATE)
+        with quiet():
+            records.save()
+        result = json.loads(run_script(filename, 'find food\n').stdout)
+        self.assertEqual([row[3] for row in result['records']], [None, 0, 0])
+
+    def test_snapshot_and_database(self):
+        rows = [('food', 'none', '-3', hw3.NO_DATE), ('food', 'old', '-5', 0)]
+        records = open_records(os.path.join(self.directory.name, 'records.txt'))
+        records.ingest(rows)
+        snapshot = os.path.join(self.directory.name, 'records.bin')
+        with quiet():
+            records.export_binary(snapshot)
+            records.save()
+        database = os.path.join(self.directory.name, 'records.db')
+        records = open_records(database)
+        records.ingest(rows)
+        with quiet():
+            records.save()
+        for filename in (snapshot, database):
+            records = open_records(filename)
+            self.check_dates(records)
+            self.assertEqual([row[3] for row in records._iter_records()], [hw3.NO_DATE, 0])
+            with quiet():
+                records.save()
+
+
+class AmountTest(unittest.TestCase):
+    """Amounts are int64 cents: the parser keeps two decimals, and no total is let out of range."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'records.txt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse_amount(self):
+        self.assertEqual([hw3.parse_amount(text) for text in ['12', '-12', '+7', '3.5', '3.50', '0.250', '-0.05']],
+                         [1200, -1200, 700, 350, 350, 25, -5])
+        for text in ['', '1.', '.5', '1.234', '1e3', '12 3', '92233720368547758.08']:
+            with self.assertRaises(ValueError):
+                hw3.parse_amount(text)
+        self.assertEqual(hw3.format_amount(-5), '-0.05')
+        self.assertEqual(hw3.format_amount(hw3.parse_amount('92233720368547758.07')), '92233720368547758.07')
+
+    def test_totals_stay_in_range(self):
+        records = open_records(self.filename)
+        big = 50000000000000000
+        self.assertEqual(records.ingest([('food', 'a', big)]).added, 1)
+        report = records.ingest([('food', 'b', big), ('salary', 'c', 1)])
+        self.assertEqual(report.added, 0)
+        self.assertEqual([(number, reason) for number, _, reason in report.errors],
+                         [(1, 'total out of range'), (2, 'total out of range')])
+        with contextlib.redirect_stderr(io.StringIO()) as errors, quiet():
+            records.add('food b 50000000000000000')
+        self.assertIn('not added', errors.getvalue())
+        self.assertEqual(records._balance, 10000 + big * 100)
+        with quiet():
+            records.find('expense')
+            records.save()
+
+        # The rejected rows were not journaled either
+        records = open_records(self.filename)
+        self.assertEqual([row[1] for row in records._iter_records()], ['a'])
+        with quiet():
+            records.save()
+        done = run_script(self.filename, 'add food b 50000000000000000\nbalance\n')
+        self.assertEqual(done.returncode, 1)
+        result = json.loads(done.stdout.splitlines()[0])
+        self.assertEqual(result['errors'][0]['reason'], 'total out of range')
+
+    def test_dollar_snapshots(self):
+        """Version 1 and 2 snapshots keep whole dollars, and open as cents."""
+        for version in (1, 2):
+            filename = os.path.join(self.directory.name, f'v{version}.bin')
+            names = [name.encode('utf-8') for name in ['food', 'lunch', 'salary', 'pay']]
+            with open(filename, 'wb') as file:
+                file.write(hw3.Snapshot.HEADER.pack(hw3.Snapshot.MAGIC, version, 100, 2, len(names)))
+                lengths = array('I', [len(name) for name in names])
+                file.write(lengths.tobytes() + b''.join(names))
+                file.write(b'\x00' * (-file.tell() % 8))
+                columns = [array('i', [0, 2]), array('i', [1, 3]), array('q', [-50, 1000])]
+                if version == 2:
+                    columns.append(array('q', [hw3.NO_DATE, 1700000000]))
+                for column in columns:
+                    if sys.byteorder == 'big':
+                        column.byteswap()
+                    file.write(column.tobytes())
+            with hw3.Snapshot(filename) as snapshot:
+                self.assertEqual(snapshot.initial_money, 10000)
+                self.assertEqual(list(snapshot.amounts), [-5000, 100000])
+            records = open_records(filename)
+            self.assertEqual(records._balance, 10000 - 5000 + 100000)
+            with quiet():
+                records.add('food dinner -0.50')
+                records.compact()
+                records.save()
+            # Rewritten as the current version, still in cents
+            with open(filename, 'rb') as file:
+                self.assertEqual(hw3.Snapshot.HEADER.unpack(file.read(hw3.Snapshot.HEADER.size))[1],
+                                 hw3.Snapshot.VERSION)
+            with hw3.Snapshot(filename) as snapshot:
+                self.assertEqual(list(snapshot.amounts), [-5000, 100000, -50])
+
+
+class RecordStoreTest(unittest.TestCase):
+    """The column store interns strings, keeps deleted rows as tombstones and hands rows out as 'Record' views."""
+
+    def test_rows_and_views(self):
+        store = hw3.RecordStore()
+        rows = [('food', 'lunch', -5000, hw3.NO_DATE), ('salary', 'pay', 100000, 1700000000),
+                ('food', 'lunch', -250, 0)]
+        positions = [store.append(*row) for row in rows]
+        self.assertEqual(store._names, ['food', 'lunch', 'salary', 'pay'])
+        record = store.record(positions[1])
+        self.assertIsInstance(record, hw3.Record)
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual((record.category, record.description, record.amount, record.timestamp), rows[1])
+
+        store.kill(positions[0])
+        self.assertFalse(store.is_live(positions[0]))
+        self.assertEqual(list(store.rows()), rows[1:])
+        self.assertEqual(store.total(), 100000 - 250)
+        self.assertEqual(store.total_at(positions), 100000 - 250)
+        compacted = store.compacted()
+        self.assertEqual(len(compacted), 2)
+        self.assertEqual(list(compacted.rows()), rows[1:])
+
+
+class StreamTest(unittest.TestCase):
+    """--stream-view and --stream-find display a ledger like view and find, without loading it."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'records.txt')
+        with open(self.filename, 'w') as file:
+            file.write('food lunch -50\nsalary pay 1000.50 2024-01-31\nnot a record\nbus ticket -2.25\nBalance: 100\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def stream(self, filename, category=None):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()) as errors:
+            status = hw3.stream_ledger(hw3.Categories(), filename, category)
+        return status, output.getvalue(), errors.getvalue()
+
+    def loaded(self, filename, category=None):
+        output = io.StringIO()
+        with contextlib.redirect_stderr(io.StringIO()):
+            records = open_records(filename)
+            with contextlib.redirect_stdout(output):
+                if category is None:
+                    records.view()
+                else:
+                    records.find(category)
+            with quiet():
+                records.save()
+        return output.getvalue()
+
+    def test_text_ledger(self):
+        for category in (None, 'expense', 'income'):
+            status, output, errors = self.stream(self.filename, category)
+            self.assertEqual(status, 0)
+            self.assertEqual(output, self.loaded(self.filename, category))
+            self.assertIn('not a record', errors)
+        self.assertEqual(self.stream(self.filename, 'nowhere')[0], 1)
+
+    def test_pending_journal(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            records = open_records(self.filename)
+        with quiet():
+            records.add('food dinner -20')
+            records.save()
+        status, output, errors = self.stream(self.filename)
+        self.assertNotIn('dinner', output)
+        self.assertIn('not saved', errors)
+
+
+class SnapshotTest(unittest.TestCase):
+    """A binary snapshot holds the same ledger as the text file, and is read in place."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.text = os.path.join(self.directory.name, 'records.txt')
+        self.binary = os.path.join(self.directory.name, 'records.bin')
+        self.rows = random_rows(random.Random(3), 300)
+        with open(self.text, 'w') as file:
+            file.writelines(ledger_line(*row) for row in self.rows)
+            file.write('Balance: 100\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def reopened_rows(self, filename):
+        records = open_records(filename)
+        with quiet():
+            records.save()
+        return list(records._iter_records())
+
+    def test_round_trip(self):
+        records = open_records(self.text)
+        with quiet():
+            records.delete_many([row[1] for row in self.rows[:20]])
+            records.export_binary(self.binary)
+            records.save()
+        expected = self.reopened_rows(self.text)
+
+        records = open_records(self.binary)
+        self.assertTrue(records._binary)
+        self.assertEqual(list(records._iter_records()), expected)
+        self.assertEqual(records.balance(), 10000 + sum(row[2] for row in expected))
+        with hw3.Snapshot(self.binary) as snapshot:
+            self.assertEqual(len(snapshot.amounts), len(expected))
+            self.assertEqual([(snapshot.names[category], snapshot.names[description], amount, timestamp)
+                              for category, description, amount, timestamp
+                              in zip(snapshot.categories, snapshot.descriptions, snapshot.amounts,
+                                     snapshot.timestamps)], expected)
+
+        # Changes go to the journal, then into a rewritten snapshot
+        with quiet():
+            records.add('food dinner -20.50 2024-02-29')
+            records.delete(expected[0][1])
+            records.save()
+        records = open_records(self.binary)
+        changed = list(records._iter_records())
+        with quiet():
+            records.compact()
+            records.save()
+        self.assertTrue(hw3.Snapshot.is_snapshot(self.binary))
+        self.assertEqual(self.reopened_rows(self.binary), changed)
+
+        text = os.path.join(self.directory.name, 'export.txt')
+        records = open_records(self.binary)
+        records.export_text(text)
+        with quiet():
+            records.save()
+        self.assertEqual(self.reopened_rows(text), changed)
+
+    def test_stream_view(self):
+        records = open_records(self.text)
+        view = io.StringIO()
+        with quiet():
+            records.export_binary(self.binary)
+            records.save()
+        records = open_records(self.binary)
+        with contextlib.redirect_stdout(view):
+            records.view()
+        with quiet():
+            records.save()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(hw3.stream_ledger(hw3.Categories(), self.binary), 0)
+        self.assertEqual(output.getvalue(), view.getvalue())
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(hw3.stream_ledger(hw3.Categories(), self.binary, 'food'), 1)
+
+
+
+class SQLiteTest(unittest.TestCase):
+    """A SQLite ledger answers every query like the in-memory indexes of a text ledger."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rng = random.Random(4)
+        rows = random_rows(self.rng, 400)
+        deleted = [row[1] for row in self.rng.sample(rows, 50)]
+        self.ledgers = []
+        for name in ('records.txt', 'records.db'):
+            records = open_records(os.path.join(self.directory.name, name))
+            records.ingest(rows)
+            with quiet():
+                records.delete_many(deleted)
+            self.ledgers.append(records)
+
+    def tearDown(self):
+        with quiet():
+            for records in self.ledgers:
+                records.save()
+        self.directory.cleanup()
+
+    def assertSame(self, query):
+        text, database = (query(records) for records in self.ledgers)
+        self.assertEqual(database, text)
+
+    def test_queries(self):
+        text, database = self.ledgers
+        self.assertIsNotNone(database._storage)
+        self.assertSame(lambda records: list(records._iter_records()))
+        self.assertSame(lambda records: records.balance())
+        self.assertSame(lambda records: records.category_totals())
+        for category in ('expense', 'food', 'drink', 'income', 'bonus'):
+            self.assertSame(lambda records: records.find_records(category))
+            self.assertSame(lambda records: records.records_between(category, 1300000000, 1600000000))
+            self.assertSame(lambda records: records.period_totals(category, 15000, 18000))
+        for query in ('tea', 'b*', 'bus c*', 'rice apple'):
+            self.assertSame(lambda records: sorted(records.search_records(hw3.parse_search(query))[0]))
+        self.assertTrue(database.verify())
+
+    def test_persisted(self):
+        text, database = self.ledgers
+        with quiet():
+            database.add('food dinner -20.50 2024-02-29')
+            database.delete('dinner')
+            database.add('salary pay 1000')
+            text.add('salary pay 1000')
+            database.save()
+        reopened = open_records(database._filename)
+        self.ledgers[1] = reopened
+        self.assertSame(lambda records: list(records._iter_records()))
+        self.assertSame(lambda records: records.balance())
+
+    def test_rename(self):
+        for records in self.ledgers:
+            with quiet():
+                records.rename_category('meal', 'dinner')
+        self.assertSame(lambda records: records.find_records('food'))
+        self.assertSame(lambda records: records.category_totals())
+        self.assertNotIn('meal', self.ledgers[1].category_totals())
+
+    def test_not_streamed(self):
+        text, database = self.ledgers
+        with quiet():
+            database.save()
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            self.assertEqual(hw3.stream_ledger(hw3.Categories(), database._filename), 1)
+        self.assertIn('cannot be streamed', errors.getvalue())
+
+
+
+class ServeTest(unittest.TestCase):
+    """The --serve mode answers pipelined commands in order, to several clients at once."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'records.txt')
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        self.server = subprocess.Popen([sys.executable, SCRIPT, self.filename, '--serve', str(self.port),
+                                        '--initial', '100'], stderr=subprocess.PIPE, text=True)
+        self.addCleanup(self.server.stderr.close)
+        for line in self.server.stderr:
+            if line.startswith('Serving'):
+                break
+
+    def tearDown(self):
+        self.server.send_signal(signal.SIGINT)
+        self.server.wait(timeout=10)
+        self.directory.cleanup()
+
+    def results(self, connection, count):
+        lines = []
+        with connection.makefile('r') as file:
+            for _ in range(count):
+                lines.append(json.loads(file.readline()))
+        return lines
+
+    def test_pipelined_requests(self):
+        with socket.create_connection(('127.0.0.1', self.port), timeout=10) as first, \
+                socket.create_connection(('127.0.0.1', self.port), timeout=10) as second:
+            # A command split over two sends is run once its line is complete
+            first.sendall(b'add food lunch -50\nadd salary pay 1000\nfind fo')
+            time.sleep(0.1)
+            first.sendall(b'od\nbogus\nbalance\n')
+            results = self.results(first, 5)
+            self.assertEqual([result['command'] for result in results], ['add', 'add', 'find', 'bogus', 'balance'])
+            self.assertEqual([row[1] for row in results[2]['records']], ['lunch'])
+            self.assertIn('error', results[3])
+            self.assertEqual(results[4]['balance'], '1050.00')
+
+            second.sendall(b'balance\n')
+            self.assertEqual(self.results(second, 1)[0]['balance'], '1050.00')
+
+        # The changes were journaled before they were answered, so another session sees them
+        records = open_records(self.filename)
+        self.assertEqual([row[1] for row in records._iter_records()], ['lunch', 'pay'])
+        with quiet():
+            records.save()
+
+    def test_loopback_only(self):
+        records = open_records(os.path.join(self.directory.name, 'other.txt'))
+        with self.assertRaises(ValueError):
+            asyncio.run(hw3.serve(records, host='0.0.0.0', port=self.port))
+        with quiet():
+            records.save()
+
+
+class CacheTest(unittest.TestCase):
+    """Cached find and view results are reused until a change reaches their categories."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with quiet():
+            self.records = hw3.Records(hw3.Categories(), os.path.join(self.directory.name, 'records.txt'),
+                                       10000, cache_size=8)
+            self.records.add('meal lunch -50, drink tea -5, salary pay 1000')
+
+    def tearDown(self):
+        with quiet():
+            self.records.save()
+        self.directory.cleanup()
+
+    def find(self, category):
+        before = self.records.cache_stats()['hits']
+        found, total = self.records.find_records(category)
+        return [row[1] for row in found], total, self.records.cache_stats()['hits'] > before
+
+    def test_invalidation(self):
+        self.assertEqual(self.find('food'), (['lunch', 'tea'], -5500, False))
+        self.assertEqual(self.find('food'), (['lunch', 'tea'], -5500, True))
+        # A change elsewhere in the tree keeps the result, one under the category drops it
+        with quiet():
+            self.records.add('bonus gift 20')
+        self.assertEqual(self.find('food'), (['lunch', 'tea'], -5500, True))
+        with quiet():
+            self.records.add('snack cake -3')
+        self.assertEqual(self.find('food'), (['lunch', 'tea', 'cake'], -5800, False))
+        self.assertEqual(self.find('meal'), (['lunch'], -5000, False))
+        with quiet():
+            self.records.delete('tea')
+        self.assertEqual(self.find('meal'), (['lunch'], -5000, True))
+        self.assertEqual(self.find('food'), (['lunch', 'cake'], -5300, False))
+        # Editing the tree changes what a category covers
+        with quiet():
+            self.records.rename_category('snack', 'sweets')
+        self.assertEqual(self.find('food'), (['lunch', 'cake'], -5300, False))
+
+    def test_view_and_eviction(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.records.view()
+        again = io.StringIO()
+        with contextlib.redirect_stdout(again):
+            self.records.view()
+        self.assertEqual(again.getvalue(), output.getvalue())
+        self.assertEqual(self.records.cache_stats()['hits'], 1)
+        with quiet():
+            self.records.add('bus ticket -2')
+        with contextlib.redirect_stdout(again):
+            self.records.view()
+        self.assertIn('ticket', again.getvalue())
+        for category in ('expense', 'food', 'meal', 'drink', 'snack', 'transport', 'bus', 'railway', 'income'):
+            self.records.find_records(category)
+        stats = self.records.cache_stats()
+        self.assertEqual(stats['entries'], 8)
+        self.assertGreater(stats['evictions'], 0)
+
+
+class RenderTest(unittest.TestCase):
+    """Rows are picked without a full sort and rendered in bulk, the totals being of the rows shown."""
+
+    def setUp(self):
+        self.rows = random_rows(random.Random(5), 500)
+
+    def test_select_rows(self):
+        by_amount = sorted(self.rows, key=lambda row: row[2])
+        self.assertEqual([row[2] for row in hw3.select_rows(self.rows, top=10)], [row[2] for row in by_amount[:-11:-1]])
+        self.assertEqual([row[2] for row in hw3.select_rows(self.rows, bottom=10)], [row[2] for row in by_amount[:10]])
+        self.assertEqual(list(hw3.select_rows(self.rows, offset=490, limit=20)), self.rows[490:])
+        self.assertEqual(list(hw3.select_rows(iter(self.rows), offset=5, limit=3)), self.rows[5:8])
+        self.assertEqual([row[2] for row in hw3.select_rows(self.rows, offset=2, limit=3, top=10)],
+                         [row[2] for row in by_amount[-3:-6:-1]])
+
+    def test_render_rows(self):
+        chunks = list(hw3.render_rows(self.rows, 'csv', chunk_rows=64))
+        self.assertEqual(len(chunks), 2 + 8)
+        parsed = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(parsed[0], ['category', 'description', 'amount', 'date'])
+        self.assertEqual(parsed[1:], [[category, description, hw3.format_amount(amount),
+                                       hw3.format_timestamp(timestamp)]
+                                      for category, description, amount, timestamp in self.rows])
+
+        document = json.loads(''.join(hw3.render_rows(self.rows, 'json', summary={'total': 2 ** 62 + 1})))
+        self.assertEqual(document['total'], hw3.format_amount(2 ** 62 + 1))
+        self.assertEqual(document['records'],
+                         [[category, description, hw3.format_amount(amount), None if timestamp == hw3.NO_DATE else timestamp]
+                          for category, description, amount, timestamp in self.rows])
+        self.assertEqual(json.loads(''.join(hw3.render_rows([], 'json'))), {'records': []})
+
+        table = ''.join(hw3.render_rows(self.rows[:2], footer='done', width=10)).splitlines()
+        self.assertEqual(table[1], '=' * 10)
+        category, description, amount, _ = self.rows[0]
+        self.assertEqual(table[2].split(), [category, *description.split(), hw3.format_amount(amount)])
+        self.assertEqual(table[-2:], ['=' * 10, 'done'])
+
+    def test_total_of_the_rows_shown(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        records = open_records(os.path.join(directory.name, 'records.txt'))
+        with quiet():
+            records.add('meal lunch -50, drink tea -5, snack cake -3, salary pay 1000')
+        output = io.StringIO()
+        records.find('food', output_format='json', bottom=2, out=output)
+        document = json.loads(output.getvalue())
+        self.assertEqual([row[1] for row in document['records']], ['lunch', 'tea'])
+        self.assertEqual(document['total'], '-55.00')
+        output = io.StringIO()
+        records.view(limit=1, out=output)
+        self.assertIn('Now you have 1042.00 dollars.', output.getvalue())
+        with quiet():
+            records.save()
+
+
+class ParserTest(unittest.TestCase):
+    """Record lines are parsed by the same rules on the fast path and the compiled pattern."""
+
+    def test_examples(self):
+        self.assertEqual(hw3.parse_record('food lunch -50'), ('food', 'lunch', -5000, hw3.NO_DATE))
+        self.assertEqual(hw3.parse_record(' food  big   lunch +3.5 2024-01-02 '),
+                         ('food', 'big lunch', 350, hw3.parse_timestamp('2024-01-02')))
+        self.assertEqual(hw3.parse_record('café crème 1'), ('café', 'crème', 100, hw3.NO_DATE))
+        self.assertEqual(hw3.parse_record('food lunch 1', 42), ('food', 'lunch', 100, 42))
+        self.assertEqual(hw3.split_record('food big  lunch 1.50'), ['food', 'big lunch', '1.50'])
+        for text in ['food lunch', 'food 12 1', 'food lunch one', 'food lunch 1 2 3', 'Balance: 5', '']:
+            self.assertIsNone(hw3.parse_record(text), text)
+        for text in ['food lunch 1.234', 'food lunch 1 tomorrow', 'food lunch 99999999999999999999']:
+            with self.assertRaises(ValueError):
+                hw3.parse_record(text)
+
+    def test_fast_path_matches_the_pattern(self):
+        rng = random.Random(6)
+        lines = []
+        expected = []
+        for _ in range(2000):
+            category = rng.choice(['food', 'salary', 'café'])
+            words = rng.sample(WORDS + ['crème'], rng.randint(1, 3))
+            amount = rng.choice(['-', '+', '']) + str(rng.randint(0, 10 ** rng.randint(1, 15)))
+            if rng.random() < 0.3:
+                amount += '.' + str(rng.randint(0, 99)).zfill(rng.randint(1, 2))
+            date = rng.choice(['', '2024-02-29', '1970-01-01', '1969-12-31T23:00:00'])
+            space = rng.choice([' ', '  ', '\t'])
+            lines.append(space.join([category, *words, amount] + ([date] if date else [])) + '\n')
+            expected.append((category, ' '.join(words), hw3.parse_amount(amount),
+                             hw3.parse_timestamp(date) if date else hw3.NO_DATE))
+        self.assertEqual([hw3.parse_record(line) for line in lines], expected)
+        reader = hw3.RecordReader(io.StringIO(''.join(lines) + 'Balance: 12.50\n'))
+        self.assertEqual(list(reader), expected)
+        self.assertEqual(reader.initial_money, 1250)
+
+if __name__ == '__main__':
+    unittest.main()